@@ -0,0 +1,90 @@
+"""Value iteration that permanently discards provably suboptimal actions."""
+import numpy as np
+
+from convergence import SweepMonitor
+from mdp import as_mdp
+
+
+def action_elimination_value_iteration(P, nS, nA, gamma=0.9, tol=1e-3, stop='span',
+                                       callback=None, V0=None, rebuild_fraction=0.1,
+                                       return_info=False):
+    """
+    Value iteration with MacQueen action elimination.
+
+    After a backup V = B V_prev with d = V - V_prev, the span bounds
+    (convergence.span_bounds) bracket V* within [V + c min(d), V + c max(d)],
+    c = gamma / (1 - gamma). One step further, with q = R + gamma T V,
+        q(s, a) + gamma c min(d) <= Q*(s, a) <= q(s, a) + gamma c max(d)
+    so action a cannot be optimal in s once
+        q(s, a) < max_b q(s, b) - gamma c sp(d).
+    Such actions are dropped for good: the MDP without them has the same V*,
+    so the remaining sweeps converge to the same answer while backing up
+    fewer (s, a) pairs.
+
+    Pruned actions are masked right away; the transition rows are only
+    re-sliced once more than rebuild_fraction of the rows still being
+    multiplied have been pruned, since slicing a CSR matrix costs about as
+    much as a sweep.
+
+    Parameters
+    ----------
+    P, nS, nA, gamma:
+        as in vi_and_pi.py
+    tol, stop, callback:
+        as in vi_and_pi.value_iteration; each callback record also holds
+        'active_actions' (remaining (s, a) pairs), 'pruned' (pairs dropped in
+        this sweep) and 'action_backups' ((s, a) pairs computed in this sweep)
+    V0: np.ndarray[nS] or None
+        Initial value function, zeros by default.
+    rebuild_fraction: float
+        Fraction of pruned rows that triggers re-slicing the transition matrix
+    return_info: bool
+        Also return a dict with 'sweeps', the total 'action_backups' and the
+        final 'active' mask, np.ndarray[nS, nA] of bool.
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+    policy: np.ndarray[nS]
+    """
+    mdp = as_mdp(P, nS, nA)
+    T = mdp.transition_csr()
+    R = mdp.R.ravel()
+    c = gamma / (1. - gamma)
+    monitor = SweepMonitor(gamma, tol, stop, callback)
+    V = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+
+    active = np.ones(nS * nA, dtype=bool)
+    rows, T_rows, R_rows = np.arange(nS * nA), T, R
+    gap = np.inf # gamma c sp(d) of the previous sweep
+    action_backups = 0
+    while True:
+        q = R_rows + gamma * T_rows.dot(V)
+        if len(rows) < nS * nA:
+            q_rows, q = q, np.full(nS * nA, -np.inf)
+            q[rows] = q_rows
+        computed = len(rows)
+        action_backups += computed
+        q[~active] = -np.inf
+
+        vf2 = np.max(q.reshape(nS, nA), axis=1)
+        pruned = active & (q.reshape(nS, nA) < (vf2 - gap)[:, None]).ravel()
+        active &= ~pruned
+        q[pruned] = -np.inf
+        n_pruned = int(np.count_nonzero(pruned))
+
+        if monitor.update(V, vf2, backups=nS, active_actions=int(np.count_nonzero(active)),
+                          pruned=n_pruned, action_backups=computed):
+            break
+        gap = gamma * c * (np.max(vf2 - V) - np.min(vf2 - V))
+        V = vf2
+        if len(rows) - np.count_nonzero(active) > rebuild_fraction * len(rows):
+            rows = np.flatnonzero(active)
+            T_rows, R_rows = T[rows], R[rows]
+
+    policy = np.argmax(q.reshape(nS, nA), axis=1)
+    value_function = monitor.estimate(V, vf2)
+    if return_info:
+        return value_function, policy, {'sweeps': monitor.sweeps,
+                                        'action_backups': action_backups,
+                                        'active': active.reshape(nS, nA)}
+    return value_function, policy
@@ -0,0 +1,122 @@
+"""Anytime planning: run a DP solver under a wall-time budget, with a certified bound."""
+import time
+
+import numpy as np
+
+from convergence import SweepMonitor, span, span_bounds
+from mdp import TabularMDP, compile_mdp
+from vi_and_pi import solve_policy_system
+
+ANYTIME_METHODS = ('value_iteration', 'modified_policy_iteration', 'policy_iteration')
+
+
+def solve(mdp, time_budget_ms, method='value_iteration', gamma=0.9, tol=0., k=10,
+          V0=None, callback=None, return_info=False):
+    """
+    Plan until the time budget runs out, then return the best certified answer.
+
+    Every iteration starts with a Bellman backup V_new = B V of the current
+    estimate V, which yields both the policy greedy with respect to V and,
+    with d = V_new - V, the MacQueen bounds of convergence.span_bounds().
+    That policy is then bound = gamma / (1 - gamma) * sp(d)-optimal, and the
+    midpoint of the bounds is within bound / 2 of V*. The methods differ in
+    how they move V on afterwards:
+    - 'value_iteration': V = V_new
+    - 'modified_policy_iteration': V_new followed by k sweeps of the greedy
+      policy's own backup
+    - 'policy_iteration': V is the exact value of the greedy policy
+
+    An iteration is only started if one taking as long as the last would
+    still end before the deadline. At least one backup always runs, since
+    there is no bound without it; the first policy evaluation of
+    'policy_iteration' is also timed only after the fact, so a budget much
+    smaller than one exact solve can be overrun by that solve.
+
+    Parameters
+    ----------
+    mdp: TabularMDP or env
+        A compiled MDP, or an environment with P, nS and nA, compiled here
+        outside of the budget (see FrozenLakeEnv.compile())
+    time_budget_ms: float
+        Wall-time budget in milliseconds
+    method: str
+        One of ANYTIME_METHODS
+    gamma: float
+        Discount factor, below 1
+    tol: float
+        Also stop once bound <= tol; with the default 0, run until the budget
+        is spent or the bound reaches 0. 'policy_iteration' also stops once
+        no action beats the evaluated policy's by more than rounding error
+        (relative 1e-12), which makes that policy optimal; rounding keeps
+        its bound slightly above 0 and can flip tied greedy actions forever.
+    k: int
+        Partial evaluation sweeps per iteration of 'modified_policy_iteration'
+    V0: np.ndarray[nS] or None
+        Initial value estimate, zeros by default
+    callback:
+        as in vi_and_pi.value_iteration, called once per iteration
+    return_info: bool
+        Also return a dict with the number of 'iterations', state 'backups'
+        and the 'elapsed' seconds.
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+        Midpoint of the span bounds, within bound / 2 of V*
+    policy: np.ndarray[nS]
+        Greedy policy of the last backup
+    bound: float
+        Certified suboptimality of policy: V*(s) - V_policy(s) <= bound for every s
+    """
+    if method not in ANYTIME_METHODS:
+        raise ValueError('Unknown anytime method: %s' % method)
+    if not isinstance(mdp, TabularMDP):
+        if hasattr(mdp, 'compile'):
+            mdp = mdp.compile(sparse=True)
+        else:
+            mdp = compile_mdp(mdp.P, mdp.nS, mdp.nA, sparse=True)
+    nS = mdp.nS
+    V = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+
+    start = last = time.perf_counter()
+    deadline = start + time_budget_ms / 1000.
+    monitor = SweepMonitor(gamma, tol, 'span', callback)
+    backups = nS
+    evaluated = None # policy whose exact value V is, for 'policy_iteration'
+    while True:
+        q = mdp.q_values(V, gamma)
+        V_new = np.max(q, axis=1)
+        policy = np.argmax(q, axis=1)
+        monitor.update(V, V_new, backups=backups)
+        lower, upper = span_bounds(V_new, V, gamma)
+        bound = gamma / (1. - gamma) * span(V_new - V)
+
+        # The next iteration is assumed to take as long as the last one
+        now = time.perf_counter()
+        step, last = now - last, now
+        if bound <= tol or now + step > deadline:
+            break
+        if evaluated is not None:
+            gain = V_new - q[np.arange(nS), evaluated]
+            if np.max(gain) <= 1e-12 * max(1., np.max(np.abs(V_new))):
+                break
+        if method == 'value_iteration':
+            V = V_new
+        elif method == 'modified_policy_iteration':
+            P_pi, r_pi = mdp.policy_model(policy)
+            V = V_new
+            for _ in range(k):
+                V = r_pi + gamma * P_pi.dot(V)
+        else:
+            P_pi, r_pi = mdp.policy_model(policy)
+            V, _ = solve_policy_system(P_pi, r_pi, gamma, 'direct')
+            evaluated = policy
+        backups = nS * (1 + k) if method == 'modified_policy_iteration' else nS
+
+    value_function = (lower + upper) / 2.
+    if return_info:
+        return value_function, policy, bound, {
+            'iterations': monitor.sweeps,
+            'backups': monitor.backups,
+            'elapsed': time.perf_counter() - start,
+        }
+    return value_function, policy, bound
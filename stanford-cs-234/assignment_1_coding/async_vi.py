@@ -0,0 +1,204 @@
+"""Asynchronous value iteration: in-place Gauss-Seidel sweeps and prioritized sweeping."""
+import heapq
+
+import numpy as np
+
+from mdp import as_mdp, predecessor_weights
+from vi_and_pi import value_iteration
+
+
+class StateBackup(object):
+    """
+    Single-state Bellman backups on the CSR rows of a TabularMDP.
+
+    q(s, V, gamma) returns the nA action values of state s; only the
+    successors listed for s are touched, so one call costs O(nA * branching).
+    """
+    def __init__(self, mdp):
+        T = mdp.transition_csr()
+        self.nA = mdp.nA
+        self.R = mdp.R
+        self.indptr = T.indptr
+        self.indices = T.indices
+        self.data = T.data
+        self.entry_action = np.repeat(np.arange(mdp.nS * mdp.nA) % mdp.nA,
+                                      np.diff(T.indptr))
+
+    def q(self, s, V, gamma):
+        lo, hi = self.indptr[s * self.nA], self.indptr[(s + 1) * self.nA]
+        expected = np.bincount(self.entry_action[lo:hi],
+                               self.data[lo:hi] * V[self.indices[lo:hi]],
+                               minlength=self.nA)
+        return self.R[s] + gamma * expected
+
+
+def gauss_seidel_value_iteration(P, nS, nA, gamma=0.9, tol=1e-3, order=None, block_size=None,
+                                 stop='span', callback=None, V0=None, return_info=False):
+    """
+    Value iteration with in-place (Gauss-Seidel) updates, one block of states at a time.
+
+    The states are visited in order, in blocks of block_size consecutive
+    states; each block is one vectorized backup that already sees the
+    values written by the blocks before it in the same sweep. The default
+    block size is about sqrt(nS), one grid row of a square lake. Sweeps run
+    until no value changes by more than tol; the result is V0 of
+    vi_and_pi.value_iteration, which applies the stopping rule stop, so the
+    answer carries the same tol guarantee as the other solvers.
+
+    Wall time matters more than backup counts here. On a 40x40 slippery lake
+    (gamma 0.9, tol 1e-3), vi_and_pi.value_iteration needs 51 sweeps and
+    0.010 s. This needs 34 in-place sweeps plus 15 certifying ones and 0.045 s,
+    since every block is a Python-level step. With block_size=1 it takes
+    about 2 s.
+
+    Parameters
+    ----------
+    P, nS, nA, gamma:
+        as in vi_and_pi.py
+    order: np.ndarray[int] or None
+        State visiting order for each sweep, default 0..nS-1. On lakes whose
+        goal is in the bottom-right corner, np.arange(nS)[::-1] converges faster.
+    block_size: int or None
+        Number of states backed up together, default ceil(sqrt(nS)).
+        block_size=1 gives classic single-state Gauss-Seidel.
+    tol, stop, callback:
+        as in vi_and_pi.value_iteration; callback only sees the certifying
+        synchronous sweeps
+    V0: np.ndarray[nS] or None
+        Initial value function, zeros by default.
+    return_info: bool
+        Also return a dict with the number of in-place 'sweeps', their
+        state 'backups' and the certifying synchronous sweeps, 'sync_sweeps'.
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+    policy: np.ndarray[nS]
+    """
+    mdp = as_mdp(P, nS, nA)
+    T = mdp.transition_csr()
+    order = np.arange(nS) if order is None else np.asarray(order)
+    block_size = block_size or int(np.ceil(np.sqrt(nS)))
+    blocks = []
+    for lo in range(0, len(order), block_size):
+        states = order[lo:lo + block_size]
+        blocks.append((states, T[(states[:, None] * nA + np.arange(nA)).ravel()],
+                       mdp.R[states]))
+    V = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+
+    sweeps = 0
+    diff = np.inf
+    while diff >= tol:
+        diff = 0.
+        for states, T_rows, R in blocks:
+            new = np.max(R + gamma * T_rows.dot(V).reshape(len(states), nA), axis=1)
+            diff = max(diff, np.max(np.abs(new - V[states])))
+            V[states] = new
+        sweeps += 1
+
+    sync_sweeps = [0]
+    def count(record):
+        sync_sweeps[0] += 1
+        if callback is not None:
+            callback(record)
+    V, policy = value_iteration(mdp, nS, nA, gamma, tol, stop, count, V)
+    if return_info:
+        return V, policy, {'sweeps': sweeps, 'backups': sweeps * len(order),
+                           'sync_sweeps': sync_sweeps[0]}
+    return V, policy
+
+
+def prioritized_sweeping(P, nS, nA, gamma=0.9, tol=1e-3, V0=None,
+                         max_backups=None, return_info=False):
+    """
+    Value iteration that always backs up the state with the largest Bellman error.
+
+    Priorities are upper bounds on each state's Bellman error. Backing up s
+    by delta raises the bound of every predecessor p by
+    gamma * max_a T[p, a, s] * delta, so when the queue holds no priority
+    above tol, max_s |(B V)(s) - V(s)| <= tol, where B is the Bellman operator.
+
+    Every backup is a Python-level heap operation, so fewer backups do not
+    mean less wall time. On a 40x40 slippery lake (gamma 0.9) with tol
+    1e-4, so that V is within 1e-3 of V*, this makes 6823 backups in 0.17 s.
+    vi_and_pi.value_iteration makes 81600 backups in 0.010 s for the same
+    guarantee. It pays off for small local changes, as in
+    incremental.IncrementalLake.
+
+    Parameters
+    ----------
+    P, nS, nA, gamma:
+        as in vi_and_pi.py
+    tol: float
+        Bellman-error threshold below which states are not queued
+    V0: np.ndarray[nS] or None
+        Initial value function, zeros by default.
+    max_backups: int or None
+        Stop early after this many single-state backups.
+    return_info: bool
+        Also return a dict with the number of 'backups'.
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+    policy: np.ndarray[nS]
+    """
+    mdp = as_mdp(P, nS, nA)
+    V = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+    priority = np.abs(np.max(mdp.q_values(V, gamma), axis=1) - V)
+    backups = sweep_priorities(StateBackup(mdp), predecessor_weights(mdp), V, priority,
+                               gamma, tol, max_backups)
+
+    policy = np.argmax(mdp.q_values(V, gamma), axis=1)
+    if return_info:
+        return V, policy, {'backups': backups}
+    return V, policy
+
+
+def sweep_priorities(backup, preds, V, priority, gamma=0.9, tol=1e-3, max_backups=None,
+                     policy=None):
+    """
+    The loop of prioritized_sweeping(), in place on V and priority.
+
+    Backs up every state whose priority exceeds tol, largest first, until
+    none is left. priority[s] must bound the Bellman error of s, and keeps
+    doing so on return, when no priority exceeds tol unless max_backups
+    stopped the loop early.
+
+    Parameters
+    ----------
+    backup:
+        Object with a q(s, V, gamma) method returning the nA action values of s,
+        such as StateBackup
+    preds: scipy.sparse.csr_matrix
+        Predecessor index as built by mdp.predecessor_weights(); weights may
+        overestimate the transition probabilities
+    policy: np.ndarray[nS] or None
+        If given, the greedy action of every backed-up state is written here
+    Returns
+    -------
+    backups: int
+        Number of single-state backups
+    """
+    queue = [(-priority[s], s) for s in np.flatnonzero(priority > tol)]
+    heapq.heapify(queue)
+
+    backups = 0
+    while queue and (max_backups is None or backups < max_backups):
+        neg_priority, s = heapq.heappop(queue)
+        if -neg_priority != priority[s]:
+            continue # stale entry, s was re-queued with a larger priority
+        priority[s] = 0.
+        q = backup.q(s, V, gamma)
+        new = q.max()
+        if policy is not None:
+            policy[s] = q.argmax()
+        delta = abs(new - V[s])
+        V[s] = new
+        backups += 1
+        if delta == 0.:
+            continue
+        lo, hi = preds.indptr[s], preds.indptr[s + 1]
+        for p, w in zip(preds.indices[lo:hi], preds.data[lo:hi]):
+            priority[p] += gamma * w * delta
+            if priority[p] > tol:
+                heapq.heappush(queue, (-priority[p], p))
+    return backups
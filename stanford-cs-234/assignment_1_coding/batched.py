@@ -0,0 +1,248 @@
+"""Solve many MDPs of the same shape (gamma / slip / map sweeps) in one vectorized pass."""
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+
+from convergence import STOPPING_RULES, converged_rows
+from mdp import TabularMDP, as_mdp
+
+
+class BatchedMDP(object):
+
+    """
+    K TabularMDPs with equal nS and nA, stacked for joint backups.
+
+    Has the following members
+    - K, nS, nA: batch size, number of states, number of actions
+    - T: transitions (*)
+    - R: expected rewards, array of shape (K, nS, nA)
+    - shared, sparse: which layout T has
+
+    (*) shared: when all K MDPs are the same (e.g. a gamma sweep), the one
+        CSR matrix of shape (nS * nA, nS); a backup of the whole batch is
+        then a single sparse-times-dense product
+        sparse: block-diagonal CSR matrix of shape (K * nS * nA, K * nS),
+        used as soon as one of the stacked MDPs is sparse, or when dense
+        ones are mostly zeros, as the lakes are
+        dense: array of shape (K, nS, nA, nS)
+
+    A stack of dense arrays soon outgrows the CPU caches that a single
+    instance fits in, so dense layouts are only kept where they are dense.
+    """
+    def __init__(self, mdps):
+        mdps = list(mdps)
+        if not mdps:
+            raise ValueError('Need at least one MDP to batch')
+        nS, nA = mdps[0].nS, mdps[0].nA
+        for mdp in mdps:
+            if not isinstance(mdp, TabularMDP):
+                raise TypeError('BatchedMDP expects compiled TabularMDPs')
+            if (mdp.nS, mdp.nA) != (nS, nA):
+                raise ValueError('All MDPs must have the same nS and nA, got '
+                                 '(%d, %d) and (%d, %d)' % (nS, nA, mdp.nS, mdp.nA))
+        self.K, self.nS, self.nA = len(mdps), nS, nA
+        self.R = np.stack([mdp.R for mdp in mdps])
+        self.shared = all(mdp is mdps[0] for mdp in mdps) or \
+            len(set(mdp.content_hash() for mdp in mdps)) == 1
+        self.sparse = any(mdp.sparse for mdp in mdps) or \
+            sum(np.count_nonzero(mdp.T) for mdp in mdps) < 0.1 * self.K * nS * nA * nS
+        if self.shared:
+            self.T = mdps[0].transition_csr()
+        elif self.sparse:
+            self.T = sp.block_diag([mdp.transition_csr() for mdp in mdps],
+                                   format='csr')
+        else:
+            self.T = np.stack([mdp.T for mdp in mdps])
+
+    def q_values(self, V, gamma):
+        """Backups for every instance. V: (K, nS), gamma: (K,). Returns (K, nS, nA)."""
+        if self.shared:
+            expected = self.T.dot(V.T).T
+        elif self.sparse:
+            expected = self.T.dot(V.ravel())
+        else:
+            # One (nS * nA, nS) product per instance, not nS * nA tiny ones
+            expected = np.matmul(self.T.reshape(self.K, self.nS * self.nA, self.nS),
+                                 V[:, :, None])
+        return self.R + gamma[:, None, None] * expected.reshape(self.K, self.nS, self.nA)
+
+    def take(self, indices):
+        """The BatchedMDP of instances indices, in that order."""
+        indices = np.asarray(indices)
+        batch = object.__new__(BatchedMDP)
+        batch.K, batch.nS, batch.nA = len(indices), self.nS, self.nA
+        batch.R = self.R[indices]
+        batch.shared, batch.sparse = self.shared, self.sparse
+        if self.shared:
+            batch.T = self.T
+        elif self.sparse:
+            n = self.nS * self.nA
+            rows = self.T[(indices[:, None] * n + np.arange(n)).ravel()]
+            batch.T = rows[:, (indices[:, None] * self.nS + np.arange(self.nS)).ravel()]
+        else:
+            batch.T = self.T[indices]
+        return batch
+
+
+def _max_over_actions(q):
+    """np.max(q, axis=-1), computed pairwise: reductions over a short last
+    axis are an order of magnitude slower than nA - 1 elementwise maxima."""
+    best = q[..., 0].copy()
+    for a in range(1, q.shape[-1]):
+        np.maximum(best, q[..., a], out=best)
+    return best
+
+
+def batched_value_iteration(mdps, gamma=0.9, tol=1e-3, max_iterations=None, stop='span'):
+    """
+    Run value iteration on K MDPs at once.
+
+    Every iteration backs up all instances together; an instance whose
+    change drops below tol is frozen, and the loop ends when all are frozen.
+    Frozen instances drop out of the batch once they make up half of it, so
+    the batch costs at most twice the backups of the instances on their own.
+
+    Parameters
+    ----------
+    mdps: BatchedMDP or list of mdp.TabularMDP
+        The K problems, all with the same nS and nA
+    gamma: float or sequence of K floats
+        Discount factor, shared or one per instance
+    tol, stop: float, str
+        Per-instance stopping rule, as in vi_and_pi.value_iteration
+    max_iterations: int or None
+        Hard cap on the number of batched iterations
+    Returns
+    -------
+    values: np.ndarray[K, nS]
+    policies: np.ndarray[K, nS]
+    iterations: np.ndarray[K]
+        Number of backups each instance needed to converge
+    """
+    if stop not in STOPPING_RULES:
+        raise ValueError('Unknown stopping rule: %s' % stop)
+    batch = mdps if isinstance(mdps, BatchedMDP) else BatchedMDP(mdps)
+    gamma = np.broadcast_to(np.asarray(gamma, dtype=float), (batch.K,))
+
+    values = np.zeros((batch.K, batch.nS))
+    policies = np.zeros((batch.K, batch.nS), dtype=int)
+    iterations = np.zeros(batch.K, dtype=int)
+    # block: the instances in batch, live: those of them still converging
+    block, live = np.arange(batch.K), np.ones(batch.K, dtype=bool)
+    V, g, q = values.copy(), gamma, None
+    while live.any():
+        if max_iterations is not None and iterations.max() >= max_iterations:
+            values[block[live]] = V[live]
+            if q is not None:
+                policies[block[live]] = np.argmax(q[live], axis=2)
+            break
+        q = batch.q_values(V, g)
+        new_V = _max_over_actions(q)
+        done = converged_rows(new_V, V, g, tol, stop)
+        iterations[block[live]] += 1
+        done &= live
+        values[block[done]] = new_V[done]
+        policies[block[done]] = np.argmax(q[done], axis=2)
+        live &= ~done
+        V = new_V
+        # Converged instances are still backed up until half the block has
+        # converged; only then is the batch rebuilt without them
+        if 0 < np.count_nonzero(live) <= len(block) // 2:
+            keep = np.flatnonzero(live)
+            batch, block, V = batch.take(keep), block[keep], V[keep]
+            g = g[keep]
+            live = np.ones(len(block), dtype=bool)
+
+    return values, policies, iterations
+
+
+def _block_diagonal(rows, nS):
+    """
+    Block-diagonal CSR matrix from K stacked (nS, nS) blocks.
+
+    rows is a CSR matrix of shape (K * nS, nS); the result has shape
+    (K * nS, K * nS), with block k in rows and columns k * nS .. (k + 1) * nS - 1.
+    """
+    K = rows.shape[0] // nS
+    offset = np.repeat(np.repeat(np.arange(K) * nS, nS), np.diff(rows.indptr))
+    return sp.csr_matrix((rows.data, rows.indices + offset, rows.indptr),
+                         shape=(K * nS, K * nS))
+
+
+def batched_policy_evaluation(P, nS, nA, policies, gamma=0.9, tol=1e-3, method='iterative',
+                              stop='span', return_info=False):
+    """
+    Evaluate K deterministic policies of one MDP at once.
+
+    The rows of every policy are gathered from the compiled transitions into
+    one block-diagonal CSR matrix of shape (K * nS, K * nS), so each sweep is
+    a single sparse product for the whole batch. Policies that appear more
+    than once are evaluated once.
+
+    Parameters
+    ----------
+    P, nS, nA, gamma:
+        as in vi_and_pi.py
+    policies: np.ndarray[K, nS]
+        One policy per row
+    tol, stop:
+        Per-policy stopping rule, as in vi_and_pi.policy_evaluation; only
+        used by the 'iterative' method
+    method: str
+        'iterative' runs stacked fixed-point sweeps. Converged policies drop
+        out of the block matrix once they make up half of it, so the batch
+        costs at most twice the sweeps of the policies on their own.
+        'direct' factorizes the block-diagonal system (I - gamma P_pi) V = r_pi
+        for all policies together.
+    return_info: bool
+        Also return a dict with the 'iterations' of each policy (sweeps, or 1
+        for the direct solve).
+    Returns
+    -------
+    values: np.ndarray[K, nS]
+        values[k] is the value function of policies[k]
+    """
+    if stop not in STOPPING_RULES:
+        raise ValueError('Unknown stopping rule: %s' % stop)
+    if method not in ('iterative', 'direct'):
+        raise ValueError('Unknown policy evaluation method: %s' % method)
+    mdp = as_mdp(P, nS, nA)
+    policies = np.ascontiguousarray(policies).reshape(-1, nS)
+    # One opaque item per policy, much cheaper to sort than np.unique(axis=0)
+    keys = policies.view(np.dtype((np.void, policies.dtype.itemsize * nS))).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    distinct, inverse = policies[first], inverse.ravel()
+    K = len(distinct)
+
+    states = np.arange(nS)
+    rows = mdp.transition_csr()[(states * nA + distinct).ravel()]
+    r_pi = mdp.R[states, distinct]
+
+    if method == 'direct':
+        A = (sp.identity(K * nS, format='csr') - gamma * _block_diagonal(rows, nS)).tocsc()
+        values = spla.spsolve(A, r_pi.ravel()).reshape(K, nS)
+        iterations = np.ones(K, dtype=int)
+    else:
+        values = np.zeros((K, nS))
+        iterations = np.zeros(K, dtype=int)
+        # block: the policies in P_pi, live: those of them still converging
+        block, live = np.arange(K), np.ones(K, dtype=bool)
+        P_pi, V, r = _block_diagonal(rows, nS), values.copy(), r_pi
+        while live.any():
+            new_V = r + gamma * P_pi.dot(V.ravel()).reshape(len(block), nS)
+            done = converged_rows(new_V, V, gamma, tol, stop)
+            iterations[block[live]] += 1
+            done &= live
+            values[block[done]] = new_V[done]
+            live &= ~done
+            V = new_V
+            # Converged policies are still swept until half the block has
+            # converged; only then is the matrix rebuilt without them
+            if 0 < np.count_nonzero(live) <= len(block) // 2:
+                block, V, r = block[live], V[live], r[live]
+                P_pi = _block_diagonal(rows[(block[:, None] * nS + states).ravel()], nS)
+                live = np.ones(len(block), dtype=bool)
+
+    if return_info:
+        return values[inverse], {'iterations': iterations[inverse]}
+    return values[inverse]
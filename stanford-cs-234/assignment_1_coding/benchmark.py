@@ -0,0 +1,157 @@
+### Benchmarks for the assignment 1 DP solvers
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+import tracemalloc
+
+from convergence import SolverTrace
+from frozen_lake import FrozenLakeEnv, generate_random_map
+from vi_and_pi import policy_iteration, value_iteration
+
+parser = argparse.ArgumentParser(description='Time the DP solvers on random lakes of growing size.',
+								formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 16, 32, 64, 128, 256, 512, 1024],
+					help="Side lengths of the generated square lakes.")
+parser.add_argument("--slips", type=float, nargs="+", default=[0.0, 0.2, 0.4],
+					help="Slip probabilities; the intended move succeeds with probability 1 - slip.")
+parser.add_argument("--solvers", nargs="+", choices=["value_iteration", "policy_iteration"],
+					default=["value_iteration", "policy_iteration"])
+parser.add_argument("--gamma", type=float, default=0.95)
+parser.add_argument("--tol", type=float, default=1e-3)
+parser.add_argument("--frozen", type=float, default=0.8,
+					help="Probability that a generated cell is frozen rather than a hole.")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--output", help="Write the results to this JSON file.")
+parser.add_argument("--baseline", help="Compare against the results in this JSON file.")
+parser.add_argument("--repeats", type=int, default=5,
+					help="Minimum timed solves per case; the fastest one is recorded.")
+parser.add_argument("--min-time", type=float, default=0.5,
+					help="Keep repeating a case's solve until this many seconds are spent on it.")
+parser.add_argument("--time-threshold", type=float, default=0.25,
+					help="Allowed relative wall-time increase over the baseline.")
+parser.add_argument("--memory-threshold", type=float, default=0.25,
+					help="Allowed relative peak-memory increase over the baseline.")
+parser.add_argument("--time-floor", type=float, default=0.01,
+					help="Wall-time increases below this many seconds are noise, not regressions.")
+parser.add_argument("--memory-floor", type=float, default=0.5,
+					help="Peak-memory increases below this many MB are noise, not regressions.")
+
+SOLVERS = {
+	'value_iteration': value_iteration,
+	'policy_iteration': policy_iteration,
+}
+
+
+def run_case(solver, size, slip, gamma=0.95, tol=1e-3, frozen=0.8, seed=0, repeats=5,
+		min_time=0.5):
+	"""Build one random lake, solve it and return a result record.
+
+	Wall time covers the solve only and is the fastest of at least repeats
+	solves, repeated until min_time seconds are spent, so that one slow run
+	does not read as a regression. Peak memory is taken
+	from one extra solve under tracemalloc, which slows it down too much to
+	time. Building and compiling the lake are reported separately as
+	build_time.
+	"""
+	t0 = time.time()
+	env = FrozenLakeEnv(desc=generate_random_map(size, frozen, seed), slip=slip)
+	mdp = env.compile(sparse=True)
+	build_time = time.time() - t0
+
+	wall_time, spent, runs = float('inf'), 0., 0
+	with contextlib.redirect_stdout(io.StringIO()):
+		while runs < repeats or spent < min_time:
+			trace = SolverTrace()
+			t0 = time.time()
+			SOLVERS[solver](mdp, env.nS, env.nA, gamma=gamma, tol=tol, callback=trace)
+			elapsed = time.time() - t0
+			wall_time, spent, runs = min(wall_time, elapsed), spent + elapsed, runs + 1
+		tracemalloc.start()
+		SOLVERS[solver](mdp, env.nS, env.nA, gamma=gamma, tol=tol)
+		_, peak = tracemalloc.get_traced_memory()
+		tracemalloc.stop()
+
+	backups = total_backups(trace, solver, env.nS, env.nA)
+	return {
+		'solver': solver,
+		'size': size,
+		'slip': slip,
+		'nS': env.nS,
+		'build_time': build_time,
+		'wall_time': wall_time,
+		'sweeps': len(trace),
+		'backups': backups,
+		'backups_per_sec': backups / wall_time if wall_time > 0 else float('inf'),
+		'peak_memory_mb': peak / 2.**20,
+	}
+
+
+def total_backups(trace, solver, nS, nA):
+	"""State backups of a whole solve from its SolverTrace.
+
+	Each SweepMonitor reports a running total, and policy_iteration starts a
+	new one for every policy evaluation, so the totals are summed at every
+	point where 'sweep' restarts from 1. Each evaluation of policy_iteration
+	is followed by an improvement step of nS * nA backups, not traced.
+	"""
+	runs = [record['backups'] for i, record in enumerate(trace.records)
+			if i + 1 == len(trace) or trace.records[i + 1]['sweep'] == 1]
+	backups = sum(runs)
+	if solver == 'policy_iteration':
+		backups += len(runs) * nS * nA
+	return backups
+
+
+def compare(results, baseline, time_threshold=0.25, memory_threshold=0.25, time_floor=0.01,
+		memory_floor=0.5):
+	"""Return a message for each case that got slower or bigger than its baseline.
+
+	An increase must exceed both the relative threshold and the absolute floor;
+	millisecond solves and kilobyte peaks vary by more than a quarter between
+	runs of the same code.
+	"""
+	key = lambda r: (r['solver'], r['size'], r['slip'])
+	reference = {key(r): r for r in baseline}
+	regressions = []
+	for result in results:
+		base = reference.get(key(result))
+		if base is None:
+			continue
+		for field, threshold, floor in (('wall_time', time_threshold, time_floor),
+										('peak_memory_mb', memory_threshold, memory_floor)):
+			if result[field] > base[field] * (1 + threshold) and result[field] > base[field] + floor:
+				regressions.append('%s size=%d slip=%.2f: %s %.4g -> %.4g (+%.0f%%)' % (
+					result['solver'], result['size'], result['slip'], field,
+					base[field], result[field], 100 * (result[field] / base[field] - 1)))
+	return regressions
+
+
+if __name__ == "__main__":
+	args = parser.parse_args()
+
+	results = []
+	for size in args.sizes:
+		for slip in args.slips:
+			for solver in args.solvers:
+				result = run_case(solver, size, slip, args.gamma, args.tol, args.frozen, args.seed,
+								  args.repeats, args.min_time)
+				print("%-17s %5dx%-5d slip=%.2f  %8.3fs  %6d sweeps  %10.0f backups/s  %8.1f MB" % (
+					solver, size, size, slip, result['wall_time'], result['sweeps'],
+					result['backups_per_sec'], result['peak_memory_mb']))
+				results.append(result)
+
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(results, f, indent=2)
+
+	if args.baseline:
+		with open(args.baseline) as f:
+			regressions = compare(results, json.load(f), args.time_threshold,
+								args.memory_threshold, args.time_floor, args.memory_floor)
+		for message in regressions:
+			print("REGRESSION " + message)
+		if regressions:
+			sys.exit(1)
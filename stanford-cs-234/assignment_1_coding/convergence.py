@@ -0,0 +1,145 @@
+"""Stopping rules and per-sweep telemetry for the DP solvers."""
+import time
+
+import numpy as np
+
+STOPPING_RULES = ('span', 'sup', 'l1')
+
+
+def span(x):
+    """Span seminorm sp(x) = max(x) - min(x)."""
+    return float(np.max(x) - np.min(x))
+
+
+def span_bounds(V_new, V_old, gamma):
+    """
+    MacQueen bounds from one backup V_new = B V_old, where B is a Bellman operator.
+
+    With d = V_new - V_old, every state satisfies
+        V_new + gamma / (1 - gamma) * min(d) <= V <= V_new + gamma / (1 - gamma) * max(d)
+    where V is the fixed point of B (V* for value iteration, V_pi for
+    policy evaluation). For value iteration the lower bound also holds for
+    the value of the policy that is greedy with respect to V_old, so that
+    policy is gamma / (1 - gamma) * sp(d)-optimal.
+
+    Returns
+    -------
+    lower, upper: np.ndarray[nS]
+    """
+    d = V_new - V_old
+    c = gamma / (1. - gamma)
+    return V_new + c * np.min(d), V_new + c * np.max(d)
+
+
+def converged_rows(V_new, V_old, gamma, tol, stop='span'):
+    """
+    SweepMonitor's stopping rule for a stack of instances, one per row.
+
+    gamma is a float or an array with one discount factor per row. Rows
+    that meet the rule under 'span' are moved in place to the midpoint of
+    their span bounds, the estimate SweepMonitor.estimate() returns.
+
+    Returns
+    -------
+    done: np.ndarray[K] of bool
+        Rows that meet the stopping rule
+    """
+    d = V_new - V_old
+    if stop == 'span':
+        c = np.broadcast_to(gamma / (1. - np.asarray(gamma, dtype=float)), (len(d),))
+        lo, hi = d.min(axis=1), d.max(axis=1)
+        done = c * (hi - lo) < tol
+        V_new[done] += (c[done] * (lo[done] + hi[done]) / 2.)[:, None]
+        return done
+    if stop == 'sup':
+        return np.max(np.abs(d), axis=1) < tol
+    return np.sum(np.abs(d), axis=1) < tol
+
+
+class SweepMonitor(object):
+
+    """
+    Decides when a synchronous DP solver stops and reports each sweep.
+
+    stop is one of
+    - 'span': stop when gamma / (1 - gamma) * sp(V_new - V_old) < tol. The
+      greedy policy of the last backup is then tol-optimal, and estimate()
+      returns the midpoint of the span bounds, within tol / 2 of the fixed
+      point. Unlike a norm of V_new - V_old, this does not grow with nS.
+    - 'sup': stop when max |V_new - V_old| < tol
+    - 'l1': stop when sum |V_new - V_old| < tol, the original rule
+
+    callback, if given, is called after every sweep with a dict holding
+    'sweep', 'residual' (max |V_new - V_old|), 'span', 'bound' (the
+    suboptimality bound of the span rule), 'backups' (cumulative state
+    backups), 'elapsed' (seconds) and 'backups_per_sec'.
+    """
+    def __init__(self, gamma, tol, stop='span', callback=None, backups_per_sweep=0):
+        if stop not in STOPPING_RULES:
+            raise ValueError('Unknown stopping rule: %s' % stop)
+        self.gamma = gamma
+        self.tol = tol
+        self.stop = stop
+        self.callback = callback
+        self.backups_per_sweep = backups_per_sweep
+        self.sweeps = 0
+        self.backups = 0
+        self.start = time.time()
+
+    def update(self, V_old, V_new, backups=None, **extra):
+        """
+        Record one sweep from V_old to V_new and return whether to stop.
+        Extra keyword arguments are added to the callback's record.
+        """
+        d = V_new - V_old
+        self.sweeps += 1
+        self.backups += self.backups_per_sweep if backups is None else backups
+        residual = float(np.max(np.abs(d)))
+        bound = self.gamma / (1. - self.gamma) * span(d)
+        if self.callback is not None:
+            elapsed = time.time() - self.start
+            record = {
+                'sweep': self.sweeps,
+                'residual': residual,
+                'span': span(d),
+                'bound': bound,
+                'backups': self.backups,
+                'elapsed': elapsed,
+                'backups_per_sec': self.backups / elapsed if elapsed > 0 else float('inf'),
+            }
+            record.update(extra)
+            self.callback(record)
+        if self.stop == 'span':
+            return bound < self.tol
+        if self.stop == 'sup':
+            return residual < self.tol
+        return float(np.sum(np.abs(d))) < self.tol
+
+    def estimate(self, V_old, V_new):
+        """Value estimate to return once update() said stop."""
+        if self.stop != 'span':
+            return V_new
+        lower, upper = span_bounds(V_new, V_old, self.gamma)
+        return (lower + upper) / 2.
+
+
+class SolverTrace(object):
+
+    """
+    Callback that keeps every per-sweep record of a SweepMonitor.
+
+    trace = SolverTrace()
+    value_iteration(P, nS, nA, callback=trace)
+    trace['residual']  # list of residuals, one per sweep
+    """
+    def __init__(self):
+        self.records = []
+
+    def __call__(self, record):
+        self.records.append(record)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, key):
+        return [record[key] for record in self.records]
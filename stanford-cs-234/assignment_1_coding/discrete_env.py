@@ -3,6 +3,8 @@ import numpy as np
 from gym import Env, spaces
 from gym.utils import seeding
 
+from mdp import compile_mdp, mdp_from_transitions
+
 def categorical_sample(prob_n, np_random):
     """
     Sample from categorical distribution
@@ -13,6 +15,191 @@ def categorical_sample(prob_n, np_random):
     return (csprob_n > np_random.rand()).argmax()
 
 
+class AliasTable(object):
+
+    """
+    Walker alias tables for sampling from many categorical distributions in O(1).
+
+    prob has shape (..., B): one distribution over B outcomes per leading
+    index, e.g. (nS, nA, B) for the outcomes of every (state, action).
+    Outcome i of a row is kept with probability threshold[..., i] and
+    replaced by alias[..., i] otherwise. Zero-probability (padding)
+    entries are never drawn.
+    """
+    def __init__(self, prob):
+        prob = np.asarray(prob, dtype=np.float64)
+        B = prob.shape[-1]
+        q = prob * B / prob.sum(axis=-1, keepdims=True)
+        threshold = np.ones_like(q)
+        alias = np.broadcast_to(np.arange(B), q.shape).copy()
+        active = np.ones(q.shape, dtype=bool)
+        # Pair the smallest remaining entry with the largest one; the mean of
+        # the remaining q stays 1, so the smallest is <= 1 <= the largest.
+        for _ in range(B - 1):
+            small = np.argmin(np.where(active, q, np.inf), axis=-1)[..., None]
+            q_large = np.where(active, q, -np.inf)
+            np.put_along_axis(q_large, small, -np.inf, axis=-1)
+            large = np.argmax(q_large, axis=-1)[..., None]
+            q_small = np.take_along_axis(q, small, axis=-1)
+            np.put_along_axis(threshold, small, q_small, axis=-1)
+            np.put_along_axis(alias, small, large, axis=-1)
+            np.put_along_axis(q, large,
+                              np.take_along_axis(q, large, axis=-1) - (1 - q_small),
+                              axis=-1)
+            np.put_along_axis(active, small, False, axis=-1)
+        self.threshold = threshold
+        self.alias = alias
+        self.B = B
+
+    def sample(self, index, np_random):
+        """
+        Draw one outcome for each distribution selected by index.
+
+        index is anything that selects rows of the leading dimensions,
+        e.g. (s, a) with scalar or array s and a. A single batched uniform
+        draw serves every row: its integer part picks the column and its
+        fractional part decides between the column and its alias.
+        """
+        threshold, alias = self.threshold[index], self.alias[index]
+        u = np_random.rand(*threshold.shape[:-1]) * self.B
+        i = u.astype(np.int64)
+        keep = np.take_along_axis(threshold, i[..., None], axis=-1)[..., 0] > u - i
+        return np.where(keep, i, np.take_along_axis(alias, i[..., None], axis=-1)[..., 0])
+
+    def sample_one(self, index, np_random):
+        """Draw one outcome of the single distribution at tuple index, e.g. (s, a)."""
+        u = np_random.rand() * self.B
+        i = int(u)
+        if u - i < self.threshold[index + (i,)]:
+            return i
+        return int(self.alias[index + (i,)])
+
+
+def _decimal_float64(x):
+    """
+    float64 copy of a float32 array, each value read back as the shortest
+    decimal that rounds to it: 0.1, not 0.10000000149011612. Values stored
+    from short decimals, as the lake probabilities are, come back exactly.
+    """
+    x = np.asarray(x, dtype=np.float32)
+    out = x.astype(np.float64)
+    todo = np.arange(out.size)
+    flat_x, flat_out = x.ravel(), out.ravel()
+    # Fewest decimal places first; values that need more than 12 keep the
+    # plain conversion
+    for places in range(13):
+        if not len(todo):
+            break
+        rounded = np.round(flat_out[todo], places)
+        hit = rounded.astype(np.float32) == flat_x[todo]
+        flat_out[todo[hit]] = rounded[hit]
+        todo = todo[~hit]
+    return out
+
+
+def _exact_probabilities(prob, row):
+    """float64 outcome probabilities, renormalized so that the entries of
+    each row (row[i] is the row of entry i) sum to 1."""
+    prob = _decimal_float64(prob)
+    return prob / np.bincount(row, prob)[row]
+
+
+class TransitionTable(object):
+
+    """
+    Compact array storage of a DiscreteEnv's transitions.
+
+    Has the following members, all of shape (nS, nA, B) where B is the
+    largest number of outcomes of any (state, action)
+    - next_s: int32 successor states
+    - prob: float32 probabilities, 0 for padding entries
+    - reward: float32 rewards
+    - done: bool terminal flags
+
+    float32 halves the memory of the probabilities and rewards; flat() and
+    TransitionView convert them back to float64 with _decimal_float64(),
+    renormalizing every row of probabilities, so compiled MDPs and P[s][a]
+    hold the same values as the original per-state loop.
+    """
+    def __init__(self, next_s, prob, reward, done):
+        self.next_s = np.asarray(next_s, dtype=np.int32)
+        self.prob = np.asarray(prob, dtype=np.float32)
+        self.reward = np.asarray(reward, dtype=np.float32)
+        self.done = np.asarray(done, dtype=bool)
+        self.nS, self.nA, self.B = self.next_s.shape
+        self._alias = None
+
+    @classmethod
+    def from_P(cls, P, nS, nA):
+        """Pack a nested P dictionary into arrays, padding with zero-probability entries."""
+        B = max(len(P[s][a]) for s in range(nS) for a in range(nA))
+        table = np.zeros((4, nS, nA, B))
+        for s in range(nS):
+            for a in range(nA):
+                for i, (p, ns, r, d) in enumerate(P[s][a]):
+                    table[:, s, a, i] = p, ns, r, d
+        prob, next_s, reward, done = table
+        return cls(next_s, prob, reward, done)
+
+    def alias_table(self):
+        """AliasTable of the outcome probabilities, built once per table."""
+        if self._alias is None:
+            self._alias = AliasTable(self.prob)
+        return self._alias
+
+    def flat(self):
+        """Non-padding entries as flat (s, a, next_s, prob, reward, done) arrays."""
+        s, a, i = np.nonzero(self.prob)
+        prob = _exact_probabilities(self.prob[s, a, i], s * self.nA + a)
+        return (s, a, self.next_s[s, a, i], prob,
+                _decimal_float64(self.reward[s, a, i]), self.done[s, a, i])
+
+
+class TransitionView(object):
+
+    """
+    Lazy read-only P[s][a] view of a TransitionTable.
+
+    P[s][a] builds the legacy [(probability, nextstate, reward, done), ...]
+    list on access, skipping padding entries.
+    """
+    def __init__(self, table):
+        self._table = table
+
+    def __len__(self):
+        return self._table.nS
+
+    def __iter__(self):
+        return iter(range(self._table.nS))
+
+    def __getitem__(self, s):
+        if not 0 <= s < self._table.nS:
+            raise KeyError(s)
+        return _StateTransitionView(self._table, s)
+
+
+class _StateTransitionView(object):
+    def __init__(self, table, s):
+        self._table = table
+        self._s = s
+
+    def __len__(self):
+        return self._table.nA
+
+    def __iter__(self):
+        return iter(range(self._table.nA))
+
+    def __getitem__(self, a):
+        if not 0 <= a < self._table.nA:
+            raise KeyError(a)
+        t, s = self._table, self._s
+        i = np.flatnonzero(t.prob[s, a])
+        prob = _exact_probabilities(t.prob[s, a, i], np.zeros(len(i), dtype=int))
+        reward = _decimal_float64(t.reward[s, a, i])
+        return [(float(p), int(ns), float(r), bool(d)) for p, ns, r, d
+                in zip(prob, t.next_s[s, a, i], reward, t.done[s, a, i])]
+
+
 class DiscreteEnv(Env):
 
     """
@@ -21,14 +208,24 @@ class DiscreteEnv(Env):
     - nA: number of actions
     - P: transitions (*)
     - isd: initial state distribution (**)
+    - transitions: the TransitionTable backing P, or None
 
     (*) dictionary dict of dicts of lists, where
       P[s][a] == [(probability, nextstate, reward, done), ...]
+      When the env is built from a TransitionTable, P is a read-only
+      TransitionView with the same indexing.
     (**) list or array of length nS
 
 
     """
     def __init__(self, nS, nA, P, isd):
+        if isinstance(P, TransitionTable):
+            self.transitions = P
+            self._outcomes = P.alias_table()
+            P = TransitionView(P)
+        else:
+            self.transitions = None
+            self._outcomes = AliasTable(TransitionTable.from_P(P, nS, nA).prob)
         self.P = P
         self.isd = isd
         self.lastaction=None # for rendering
@@ -38,9 +235,25 @@ class DiscreteEnv(Env):
         self.action_space = spaces.Discrete(self.nA)
         self.observation_space = spaces.Discrete(self.nS)
 
+        self._compiled = {}
+
         self._seed()
         self._reset()
 
+    def compile(self, sparse=False):
+        """
+        Return P as a mdp.TabularMDP, compiling it on first use.
+        With sparse=True the transitions are a CSR matrix of shape (nS * nA, nS).
+        """
+        if sparse not in self._compiled:
+            if self.transitions is not None:
+                s, a, ns, p, r, _ = self.transitions.flat()
+                mdp = mdp_from_transitions(self.nS, self.nA, s, a, ns, p, r, sparse)
+            else:
+                mdp = compile_mdp(self.P, self.nS, self.nA, sparse)
+            self._compiled[sparse] = mdp
+        return self._compiled[sparse]
+
     def _seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
         return [seed]
@@ -51,9 +264,13 @@ class DiscreteEnv(Env):
         return self.s
 
     def _step(self, a):
-        transitions = self.P[self.s][a]
-        i = categorical_sample([t[0] for t in transitions], self.np_random)
-        p, s, r, d= transitions[i]
+        i = self._outcomes.sample_one((self.s, a), self.np_random)
+        if self.transitions is not None:
+            t = self.transitions
+            p, s, r, d = (float(t.prob[self.s, a, i]), int(t.next_s[self.s, a, i]),
+                          float(t.reward[self.s, a, i]), bool(t.done[self.s, a, i]))
+        else:
+            p, s, r, d = self.P[self.s][a][i]
         self.s = s
         self.lastaction=a
         return (s, r, d, {"prob" : p})
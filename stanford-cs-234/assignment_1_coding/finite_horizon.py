@@ -0,0 +1,101 @@
+"""Finite-horizon planning by backward induction, with compact time-indexed policies."""
+import numpy as np
+
+from mdp import as_mdp
+
+
+class TimeIndexedPolicy(object):
+
+    """
+    Deterministic policy for steps t = 0..H-1 of an episode.
+
+    policy[t] is the np.ndarray[nS] of actions to take at step t, with H - t
+    steps left. Runs of identical consecutive layers are stored once, as
+    uint8 arrays, so memory grows with the number of distinct layers rather
+    than with H. Once the horizon is long enough for the values to settle,
+    all early steps share one layer.
+
+    Has the following members
+    - horizon: H
+    - layers: np.ndarray[L, nS] of uint8, the distinct layers
+    - starts: np.ndarray[L], first step using each layer, starts[0] == 0
+    """
+    def __init__(self, layers, starts, horizon):
+        self.layers = layers
+        self.starts = starts
+        self.horizon = horizon
+
+    @property
+    def shape(self):
+        return (self.horizon, self.layers.shape[1])
+
+    def __len__(self):
+        return self.horizon
+
+    def __getitem__(self, t):
+        if not 0 <= t < self.horizon:
+            raise IndexError('step %d outside horizon %d' % (t, self.horizon))
+        return self.layers[np.searchsorted(self.starts, t, side='right') - 1]
+
+    def to_array(self):
+        """The full (H, nS) uint8 array."""
+        return np.repeat(self.layers, np.diff(np.append(self.starts, self.horizon)), axis=0)
+
+
+def backward_induction(P, nS, nA, horizon, gamma=1.0, return_values=False):
+    """
+    Optimal policy for episodes cut off after horizon steps.
+
+    Runs exactly horizon backups V_t = max_a R + gamma T V_{t+1}, from
+    V_H = 0 down to V_0; no stopping rule is involved and gamma = 1 is
+    allowed. Where the previous layer's action is still optimal it is kept,
+    so ties do not break up runs of identical layers.
+
+    Parameters
+    ----------
+    P, nS, nA:
+        as in vi_and_pi.py; nA must be at most 256
+    horizon: int
+        Number of steps H, e.g. the max_steps of render_single()
+    gamma: float
+        Discount factor in [0, 1]
+    return_values: bool
+        Also return the (H + 1, nS) array of values V_t, V_H being 0.
+        Without it only V_0 is kept.
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+        V_0, the expected return of an episode started in each state
+    policy: TimeIndexedPolicy
+    """
+    if nA > 256:
+        raise ValueError('uint8 policies hold at most 256 actions, got %d' % nA)
+    mdp = as_mdp(P, nS, nA)
+    states = np.arange(nS)
+    V = np.zeros(nS)
+    values = [V] if return_values else None
+
+    # Layers are found from t = H - 1 down to 0 and reversed at the end
+    layers, ends = [], []
+    layer = None
+    for t in range(horizon - 1, -1, -1):
+        q = mdp.q_values(V, gamma)
+        V = np.max(q, axis=1)
+        best = np.argmax(q, axis=1)
+        if layer is not None:
+            best = np.where(q[states, layer] >= V, layer, best)
+        if layer is None or np.any(best != layer):
+            layer = best.astype(np.uint8)
+            layers.append(layer)
+            ends.append(t)
+        if return_values:
+            values.append(V)
+
+    # ends[i] is the last step of layers[i]; after reversing, the first
+    # step of each layer is one past the last step of the layer before it
+    layers = np.array(layers[::-1], dtype=np.uint8).reshape(-1, nS)
+    starts = np.append(0, np.array(ends[:0:-1]) + 1).astype(np.int64)
+    policy = TimeIndexedPolicy(layers, starts, horizon)
+    if return_values:
+        return np.array(values[::-1]), policy
+    return V, policy
@@ -1,5 +1,6 @@
 import numpy as np
 import sys
+from scipy import ndimage
 from six import StringIO, b
 from gym import utils
 import discrete_env
@@ -30,6 +31,78 @@ MAPS = {
     ],
 }
 
+# Row and column offsets of each action, indexed by LEFT, DOWN, RIGHT, UP
+ROW_STEP = np.array([0, 1, 0, -1], dtype=np.int32)
+COL_STEP = np.array([-1, 0, 1, 0], dtype=np.int32)
+
+def generate_random_map(size=8, p=0.8, seed=None, max_tries=1000):
+    """
+    Random size x size map with S in the top-left and G in the bottom-right corner.
+
+    Every other cell is frozen with probability p and a hole otherwise.
+    Maps are redrawn until G is reachable from S, at most max_tries times;
+    on large maps with p below the percolation threshold (about 0.59) that
+    almost never happens, and a ValueError is raised instead.
+    """
+    if not 0 < p <= 1:
+        raise ValueError('p must be in (0, 1], got {}'.format(p))
+    rng = np.random.RandomState(seed)
+    for _ in range(max_tries):
+        frozen = rng.rand(size, size) < p
+        frozen[0, 0] = frozen[-1, -1] = True
+        labels, _ = ndimage.label(frozen)
+        if labels[0, 0] == labels[-1, -1]:
+            break
+    else:
+        raise ValueError('No {0}x{0} map with p={1} connects S to G after {2} tries'.format(
+            size, p, max_tries))
+    desc = np.where(frozen, b'F', b'H')
+    desc[0, 0], desc[-1, -1] = b'S', b'G'
+    return [row.tobytes().decode() for row in desc]
+
+def build_transitions(desc, is_slippery=True, slip=0.2, states=None):
+    """
+    Compute the FrozenLake dynamics of a map as a discrete_env.TransitionTable.
+
+    Vectorized over the whole grid. Outcomes are listed in the same order
+    and with the same values as the original per-state loop built into P:
+    on a slippery lake, action a moves in directions (a-1)%4, a, (a+1)%4
+    with probabilities slip/2, 1-slip, slip/2 (0.1, 0.8, 0.1 by default);
+    holes and the goal are absorbing.
+
+    With states, an array of state indices, only their rows are built and
+    the table has shape (len(states), nA, B); next_s still indexes the
+    whole grid.
+    """
+    desc = np.asarray(desc, dtype='c')
+    nrow, ncol = desc.shape
+    nA = 4
+    letters = desc.ravel()
+    states = np.arange(nrow * ncol, dtype=np.int32) if states is None else np.asarray(states)
+    terminal = (letters[states] == b'G') | (letters[states] == b'H')
+
+    row, col = np.divmod(states.astype(np.int32), ncol)
+    if is_slippery:
+        direction = (np.arange(nA)[:, None] + np.array([-1, 0, 1])) % 4
+        prob = np.array([slip / 2., 1. - slip, slip / 2.])
+    else:
+        direction = np.arange(nA)[:, None]
+        prob = np.array([1.0])
+    newrow = np.clip(row[:, None, None] + ROW_STEP[direction], 0, nrow - 1)
+    newcol = np.clip(col[:, None, None] + COL_STEP[direction], 0, ncol - 1)
+    next_s = newrow * ncol + newcol
+    prob = np.broadcast_to(prob, next_s.shape).copy()
+    reward = (letters[next_s] == b'G').astype(np.float32)
+    done = (letters[next_s] == b'G') | (letters[next_s] == b'H')
+
+    # Holes and the goal loop back to themselves with reward 0
+    next_s[terminal] = states[terminal, None, None]
+    prob[terminal] = 0.
+    prob[terminal, :, 0] = 1.
+    reward[terminal] = 0.
+    done[terminal] = True
+    return discrete_env.TransitionTable(next_s, prob, reward, done)
+
 class FrozenLakeEnv(discrete_env.DiscreteEnv):
     """
     Winter is here. You and your friends were tossing around a frisbee at the park
@@ -58,7 +131,7 @@ class FrozenLakeEnv(discrete_env.DiscreteEnv):
 
     metadata = {'render.modes': ['human', 'ansi']}
 
-    def __init__(self, desc=None, map_name="4x4",is_slippery=True):
+    def __init__(self, desc=None, map_name="4x4",is_slippery=True, slip=0.2, transitions=None):
         if desc is None and map_name is None:
             raise ValueError('Must provide either desc or map_name')
         elif desc is None:
@@ -72,45 +145,8 @@ class FrozenLakeEnv(discrete_env.DiscreteEnv):
         isd = np.array(desc == b'S').astype('float64').ravel()
         isd /= isd.sum()
 
-        P = {s : {a : [] for a in range(nA)} for s in range(nS)}
-
-        def to_s(row, col):
-            return row*ncol + col
-        def inc(row, col, a):
-            if a==0: # left
-                col = max(col-1,0)
-            elif a==1: # down
-                row = min(row+1,nrow-1)
-            elif a==2: # right
-                col = min(col+1,ncol-1)
-            elif a==3: # up
-                row = max(row-1,0)
-            return (row, col)
-
-        for row in range(nrow):
-            for col in range(ncol):
-                s = to_s(row, col)
-                for a in range(4):
-                    li = P[s][a]
-                    letter = desc[row, col]
-                    if letter in b'GH':
-                        li.append((1.0, s, 0, True))
-                    else:
-                        if is_slippery:
-                            for b in [(a-1)%4, a, (a+1)%4]:
-                                newrow, newcol = inc(row, col, b)
-                                newstate = to_s(newrow, newcol)
-                                newletter = desc[newrow, newcol]
-                                done = bytes(newletter) in b'GH'
-                                rew = float(newletter == b'G')
-                                li.append((0.8 if b==a else 0.1, newstate, rew, done))
-                        else:
-                            newrow, newcol = inc(row, col, a)
-                            newstate = to_s(newrow, newcol)
-                            newletter = desc[newrow, newcol]
-                            done = bytes(newletter) in b'GH'
-                            rew = float(newletter == b'G')
-                            li.append((1.0, newstate, rew, done))
+        # transitions: a precomputed TransitionTable for desc, e.g. from a cache
+        P = build_transitions(desc, is_slippery, slip) if transitions is None else transitions
 
         super(FrozenLakeEnv, self).__init__(nS, nA, P, isd)
 
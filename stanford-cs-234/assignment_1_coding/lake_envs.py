@@ -1,5 +1,10 @@
 # coding: utf-8
 """Defines some frozen lake maps."""
+import os
+import re
+import shutil
+import tempfile
+
 import gym
 from gym.envs.toy_text import frozen_lake, discrete
 from gym.envs.registration import register
@@ -33,4 +38,91 @@ register(
     id='Stochastic-4x4-FrozenLake-v0',
     entry_point='gym.envs.toy_text.frozen_lake:FrozenLakeEnv',
     kwargs={'map_name': '4x4',
-            'is_slippery': True})
\ No newline at end of file
+            'is_slippery': True})
+
+# Procedurally generated lakes, registered on first lookup so that importing
+# this module costs the same however many variants exist. For example
+#   gym.make('Random-256x256-p0.8-seed3-FrozenLake-v0')
+#   gym.make('Random-64x64-p0.9-seed0-slip0-FrozenLake-v0')
+# is a random map (frozen_lake.generate_random_map) with the given side
+# lengths, frozen-cell probability p and seed, and slip probability slip
+# (default 0.2, i.e. the 0.1/0.8/0.1 slippery lake; slip0 is deterministic).
+RANDOM_LAKE_RE = re.compile(
+    r'^Random-(\d+)x(\d+)-p(\d*\.?\d+)-seed(\d+)(?:-slip(\d*\.?\d+))?-FrozenLake-v0$')
+LAKE_CACHE_DIR = os.environ.get(
+    'LAKE_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'frozen_lake'))
+# Part of the on-disk cache path; bump it when build_transitions or
+# generate_random_map change what an id maps to
+LAKE_CACHE_VERSION = 1
+
+# id -> (desc, TransitionTable, compiled MDPs shared by every env of that id)
+_lake_cache = {}
+
+
+def make_random_lake(lake_id, size, p, seed, slip):
+    """Entry point of the Random-* ids: build the env from the cached map and arrays."""
+    from frozen_lake import FrozenLakeEnv
+    desc, table, compiled = _load_random_lake(lake_id, size, p, seed, slip)
+    env = FrozenLakeEnv(desc=desc, slip=slip, transitions=table)
+    env._compiled = compiled
+    return env
+
+
+def _load_random_lake(lake_id, size, p, seed, slip):
+    """Map and transition arrays of a Random-* id, from memory, disk or a fresh build."""
+    if lake_id in _lake_cache:
+        return _lake_cache[lake_id]
+    import numpy as np
+    from frozen_lake import build_transitions, generate_random_map
+    from out_of_core import load_transitions, save_transitions
+
+    root = os.path.join(LAKE_CACHE_DIR, 'v%d' % LAKE_CACHE_VERSION)
+    directory = os.path.join(root, lake_id)
+    if os.path.exists(directory):
+        desc = np.load(os.path.join(directory, 'desc.npy'))
+        table = load_transitions(directory)
+    else:
+        desc = np.asarray(generate_random_map(size, p, seed), dtype='c')
+        table = build_transitions(desc, slip > 0, slip)
+        # Written aside and renamed into place, so no process ever maps a
+        # half-written file; if another process got there first, keep its copy
+        os.makedirs(root, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=lake_id + '.', suffix='.tmp', dir=root)
+        try:
+            save_transitions(table, tmp)
+            np.save(os.path.join(tmp, 'desc.npy'), desc)
+            os.replace(tmp, directory)
+        except OSError:
+            if not os.path.exists(directory):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    _lake_cache[lake_id] = (desc, table, {})
+    return _lake_cache[lake_id]
+
+
+def _register_random_lake(lake_id):
+    match = RANDOM_LAKE_RE.match(lake_id)
+    if match is None:
+        return
+    nrow, ncol, p, seed, slip = match.groups()
+    if nrow != ncol:
+        raise gym.error.Error('Random lakes must be square, got {}'.format(lake_id))
+    if not 0 < float(p) <= 1:
+        raise gym.error.Error('Random lakes need p in (0, 1], got {}'.format(lake_id))
+    register(
+        id=lake_id,
+        entry_point='lake_envs:make_random_lake',
+        kwargs={'lake_id': lake_id,
+                'size': int(nrow),
+                'p': float(p),
+                'seed': int(seed),
+                'slip': 0.2 if slip is None else float(slip)})
+
+
+def _lookup_spec(lake_id, _spec=gym.envs.registration.registry.spec):
+    if lake_id not in gym.envs.registration.registry.env_specs:
+        _register_random_lake(lake_id)
+    return _spec(lake_id)
+
+gym.envs.registration.registry.spec = _lookup_spec
@@ -0,0 +1,104 @@
+"""Value iteration along the rows and columns of grid MDPs such as the lakes."""
+import numpy as np
+
+from mdp import as_mdp
+from vi_and_pi import value_iteration
+
+
+class LineSweeper(object):
+
+    """
+    In-place value iteration along the lines of a grid.
+
+    State s sits in cell (row[s], col[s]). A sweep backs up one grid row (or
+    column) at a time, each line in one vectorized backup that already sees
+    the lines updated before it, so values travel the whole length of the
+    grid in a single sweep instead of one cell. Sweeps cycle through rows
+    top-down, rows bottom-up, columns left-right and columns right-left.
+
+    The transition rows of every line are sliced once, so the sweeper holds
+    two extra copies of T.
+    """
+    def __init__(self, mdp, row, col):
+        T = mdp.transition_csr()
+        self.nA = nA = mdp.nA
+        self.lines = []
+        for coord, other in ((row, col), (col, row)):
+            order = np.lexsort((other, coord))
+            starts = np.flatnonzero(np.diff(coord[order])) + 1
+            lines = []
+            for states in np.split(order, starts):
+                T_rows = T[(states[:, None] * nA + np.arange(nA)).ravel()]
+                lines.append((states, T_rows, mdp.R[states]))
+            self.lines.append(lines)
+
+    def sweep(self, V, gamma, direction):
+        """One in-place sweep of V in direction 0..3; returns max |change|."""
+        lines = self.lines[direction // 2]
+        if direction % 2:
+            lines = lines[::-1]
+        change = 0.
+        for states, T_rows, R in lines:
+            new = np.max(R + gamma * T_rows.dot(V).reshape(len(states), self.nA), axis=1)
+            change = max(change, np.max(np.abs(new - V[states])))
+            V[states] = new
+        return change
+
+
+def line_sweep_value_iteration(P, nS, nA, shape, gamma=0.9, tol=1e-3, stop='span',
+                               callback=None, V0=None, return_info=False):
+    """
+    Value iteration that propagates values along grid lines, then certifies.
+
+    Synchronous value iteration moves value information about one cell per
+    sweep, so a lake of side n needs O(n) sweeps. LineSweeper sweeps are run
+    until no value changes by more than (1 - gamma) * tol; the result is V0
+    of vi_and_pi.value_iteration, which applies the usual stopping rule,
+    typically after a single sweep, so the answer carries the same tol
+    guarantee.
+
+    A line sweep costs several synchronous sweeps of Python-level work, so
+    this only pays off on large maps, 512x512 and up; there the deterministic
+    lake went from 1023 sweeps to 202 line sweeps. On mid-size slippery lakes
+    it is slower than vi_and_pi.value_iteration: at 128x128, slip 0.2,
+    gamma 0.99 it took 1.3 s against 0.6 s. Keep value_iteration as the
+    default and reach for this on big lakes only.
+
+    Parameters
+    ----------
+    P, nS, nA, gamma:
+        as in vi_and_pi.py
+    shape: (int, int)
+        (nrow, ncol) of the grid, state s being cell divmod(s, ncol), as
+        for FrozenLakeEnv
+    tol, stop, callback:
+        as in vi_and_pi.value_iteration; callback only sees the certifying
+        synchronous sweeps
+    V0: np.ndarray[nS] or None
+        Initial value function, zeros by default.
+    return_info: bool
+        Also return a dict with the number of 'line_sweeps' and 'sweeps'
+        (certifying synchronous sweeps).
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+    policy: np.ndarray[nS]
+    """
+    mdp = as_mdp(P, nS, nA, sparse=True)
+    row, col = np.divmod(np.arange(nS), shape[1])
+    sweeper = LineSweeper(mdp, row, col)
+    V = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+
+    line_sweeps = 1
+    while sweeper.sweep(V, gamma, (line_sweeps - 1) % 4) >= (1 - gamma) * tol:
+        line_sweeps += 1
+
+    sweeps = [0]
+    def count(record):
+        sweeps[0] += 1
+        if callback is not None:
+            callback(record)
+    V, policy = value_iteration(mdp, nS, nA, gamma, tol, stop, count, V)
+    if return_info:
+        return V, policy, {'line_sweeps': line_sweeps, 'sweeps': sweeps[0]}
+    return V, policy
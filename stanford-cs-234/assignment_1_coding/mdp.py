@@ -0,0 +1,162 @@
+"""Array form of the tabular MDPs solved in vi_and_pi.py."""
+import hashlib
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class TabularMDP(object):
+
+    """
+    Transition and reward arrays compiled from a DiscreteEnv's P.
+
+    Has the following members
+    - nS: number of states
+    - nA: number of actions
+    - T: transition probabilities (*)
+    - R: expected immediate rewards (**)
+    - sparse: whether T is stored as a CSR matrix
+
+    (*) dense: array of shape (nS, nA, nS), T[s, a, s'] == Pr(s' | s, a)
+        sparse: scipy.sparse.csr_matrix of shape (nS * nA, nS), where row
+        s * nA + a holds Pr(. | s, a). Memory is O(nS * nA * branching).
+    (**) array of shape (nS, nA), R[s, a] == E[r | s, a]
+
+    Terminal flags are not stored: as in the original solvers, terminal
+    states are absorbing self-loops with zero reward, so their value is 0.
+    """
+    def __init__(self, nS, nA, T, R):
+        self.nS = nS
+        self.nA = nA
+        self.T = T
+        self.R = R
+        self.sparse = sp.issparse(T)
+        self._hash = None
+
+    def q_values(self, V, gamma):
+        """One Bellman backup for every (s, a): R + gamma * T V, shape (nS, nA)."""
+        return self.R + gamma * self.T.dot(V).reshape(self.nS, self.nA)
+
+    def policy_model(self, policy):
+        """Rows of T and R selected by a deterministic policy.
+
+        Returns (P_pi, r_pi) with P_pi of shape (nS, nS) and r_pi of shape (nS,).
+        P_pi is a CSR matrix when the MDP is sparse.
+        """
+        states = np.arange(self.nS)
+        policy = np.asarray(policy)
+        if self.sparse:
+            P_pi = self.T[states * self.nA + policy]
+        else:
+            P_pi = self.T[states, policy]
+        return P_pi, self.R[states, policy]
+
+    def content_hash(self):
+        """
+        SHA-256 hex digest of nS, nA, T and R, identical for dense and sparse storage.
+        Computed once; the arrays are not expected to change afterwards.
+        """
+        if self._hash is None:
+            T = self.transition_csr().copy()
+            T.sum_duplicates()
+            T.eliminate_zeros()
+            h = hashlib.sha256()
+            h.update(np.array([self.nS, self.nA], dtype=np.int64).tobytes())
+            h.update(T.indptr.astype(np.int64).tobytes())
+            h.update(T.indices.astype(np.int64).tobytes())
+            h.update(np.ascontiguousarray(T.data, dtype=np.float64).tobytes())
+            h.update(np.ascontiguousarray(self.R, dtype=np.float64).tobytes())
+            self._hash = h.hexdigest()
+        return self._hash
+
+    def transition_csr(self):
+        """T as a CSR matrix of shape (nS * nA, nS), whatever the storage."""
+        if self.sparse:
+            return self.T
+        return sp.csr_matrix(self.T.reshape(self.nS * self.nA, self.nS))
+
+
+def predecessor_weights(mdp):
+    """Predecessor index of an MDP.
+
+    Returns a CSR matrix W of shape (nS, nS) where row s' lists every state s
+    that can reach s' in one step, with W[s', s] == max_a T[s, a, s'].
+    """
+    T = mdp.transition_csr().tocoo()
+    key = T.col.astype(np.int64) * mdp.nS + T.row // mdp.nA
+    order = np.argsort(key, kind='stable')
+    key, prob = key[order], T.data[order]
+    first = np.flatnonzero(np.r_[True, key[1:] != key[:-1]])
+    if len(key) == 0:
+        return sp.csr_matrix((mdp.nS, mdp.nS))
+    weight = np.maximum.reduceat(prob, first)
+    key = key[first]
+    return sp.csr_matrix((weight, (key // mdp.nS, key % mdp.nS)),
+                         shape=(mdp.nS, mdp.nS))
+
+
+def transition_graph(mdp):
+    """Adjacency of the states: CSR matrix G of shape (nS, nS), G[s, s'] == 1
+    if T[s, a, s'] > 0 for some action a."""
+    T = mdp.transition_csr().tocoo()
+    positive = T.data > 0
+    G = sp.csr_matrix((np.ones(np.count_nonzero(positive)),
+                       (T.row[positive] // mdp.nA, T.col[positive])),
+                      shape=(mdp.nS, mdp.nS))
+    G.data[:] = 1.
+    return G
+
+
+def flatten_transitions(P, nS, nA):
+    """Walk the nested P[s][a] lists once and return them as flat arrays.
+
+    Returns
+    -------
+    s, a, next_s: np.ndarray[int]
+    prob, reward: np.ndarray[float]
+    done: np.ndarray[bool]
+        One entry per (probability, nextstate, reward, terminal) tuple in P.
+    """
+    rows = [(s, a, p, ns, r, d)
+            for s in range(nS) for a in range(nA) for p, ns, r, d in P[s][a]]
+    if not rows:
+        empty_i, empty_f = np.zeros(0, dtype=int), np.zeros(0)
+        return empty_i, empty_i, empty_i, empty_f, empty_f, np.zeros(0, dtype=bool)
+    s, a, prob, next_s, reward, done = zip(*rows)
+    return (np.array(s), np.array(a), np.array(next_s),
+            np.array(prob, dtype=float), np.array(reward, dtype=float),
+            np.array(done, dtype=bool))
+
+
+def mdp_from_transitions(nS, nA, s, a, next_s, prob, reward, sparse=False):
+    """Build a TabularMDP from flat transition arrays.
+
+    Duplicate (s, a, s') entries are summed, so every outcome listed in
+    P[s][a] contributes, not just the first one.
+    """
+    R = np.bincount(s * nA + a, weights=prob * reward,
+                    minlength=nS * nA).reshape(nS, nA)
+    if sparse:
+        T = sp.csr_matrix((prob, (s * nA + a, next_s)), shape=(nS * nA, nS))
+        T.sum_duplicates()
+    else:
+        T = np.zeros((nS, nA, nS))
+        np.add.at(T, (s, a, next_s), prob)
+    return TabularMDP(nS, nA, T, R)
+
+
+def compile_mdp(P, nS, nA, sparse=False):
+    """Compile a nested P dictionary into a TabularMDP.
+
+    Use sparse=True for large maps: a dense (nS, nA, nS) tensor is quadratic
+    in nS, while the CSR form only stores the listed successors.
+    """
+    s, a, next_s, prob, reward, _ = flatten_transitions(P, nS, nA)
+    return mdp_from_transitions(nS, nA, s, a, next_s, prob, reward, sparse)
+
+
+def as_mdp(P, nS, nA, sparse=False):
+    """Return P unchanged if it is already compiled, otherwise compile it."""
+    if isinstance(P, TabularMDP):
+        return P
+    return compile_mdp(P, nS, nA, sparse)
@@ -0,0 +1,159 @@
+"""
+Value iteration over transition tables stored on disk and memory-mapped.
+
+On-disk layout of a transition table, one directory per MDP:
+
+    meta.json    {"nS": ..., "nA": ..., "B": ...}
+    next_s.npy   int32   (nS, nA, B)  successor states
+    prob.npy     float32 (nS, nA, B)  probabilities, 0 for padding entries
+    reward.npy   float32 (nS, nA, B)  rewards
+    done.npy     bool    (nS, nA, B)  terminal flags
+
+i.e. the arrays of a discrete_env.TransitionTable saved as .npy files, so
+np.load(..., mmap_mode='r') maps them without reading them into memory.
+"""
+import json
+import mmap
+import os
+
+import numpy as np
+
+from convergence import SweepMonitor
+from discrete_env import TransitionTable
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+TRANSITION_FIELDS = (('next_s', np.int32), ('prob', np.float32),
+                     ('reward', np.float32), ('done', np.bool_))
+
+
+def create_transition_files(directory, nS, nA, B):
+    """
+    Create an empty on-disk table and return it as a writable TransitionTable of memmaps.
+
+    Fill it chunk by chunk (e.g. table.next_s[lo:hi] = ...) to generate
+    MDPs larger than RAM, then call flush_transition_files(table).
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump({'nS': nS, 'nA': nA, 'B': B}, f)
+    arrays = [np.lib.format.open_memmap(os.path.join(directory, name + '.npy'), mode='w+',
+                                        dtype=dtype, shape=(nS, nA, B))
+              for name, dtype in TRANSITION_FIELDS]
+    return TransitionTable(*arrays)
+
+
+def flush_transition_files(table):
+    """Write the pages of a table from create_transition_files() back to disk."""
+    for name, _ in TRANSITION_FIELDS:
+        getattr(table, name).base.flush()
+
+
+def save_transitions(table, directory, chunk_states=65536):
+    """Write an in-memory TransitionTable to directory, chunk_states states at a time."""
+    out = create_transition_files(directory, table.nS, table.nA, table.B)
+    for lo in range(0, table.nS, chunk_states):
+        for name, _ in TRANSITION_FIELDS:
+            getattr(out, name)[lo:lo + chunk_states] = getattr(table, name)[lo:lo + chunk_states]
+    flush_transition_files(out)
+
+
+def load_transitions(directory):
+    """Memory-map an on-disk table read-only as a TransitionTable."""
+    arrays = [np.load(os.path.join(directory, name + '.npy'), mmap_mode='r')
+              for name, _ in TRANSITION_FIELDS]
+    return TransitionTable(*arrays)
+
+
+def _resident_pages(directory):
+    """
+    Pages of the files in directory currently mapped into this process,
+    from the Rss of their mappings in /proc/self/smaps; None where that
+    file does not exist (not Linux).
+    """
+    try:
+        f = open('/proc/self/smaps')
+    except OSError:
+        return None
+    directory = os.path.realpath(directory) + os.sep
+    kilobytes, inside = 0, False
+    with f:
+        for line in f:
+            fields = line.split()
+            if fields[0][-1] != ':':
+                # Mapping header: address perms offset dev inode [path]
+                inside = len(fields) > 5 and fields[5].startswith(directory)
+            elif inside and fields[0] == 'Rss:':
+                kilobytes += int(fields[1])
+    return kilobytes * 1024 // mmap.PAGESIZE
+
+
+def _major_faults():
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_majflt
+
+
+def out_of_core_value_iteration(directory, gamma=0.9, tol=1e-3, chunk_states=65536,
+                                stop='span', callback=None, V0=None, return_info=False):
+    """
+    Value iteration streaming the transition table from disk in state chunks.
+
+    Only V, the next V and the greedy policy (O(nS)) live in RAM. Each sweep
+    maps the table, backs up chunk_states states at a time and unmaps it
+    again; mapped pages are clean and file-backed, so the OS can drop them
+    at any time instead of swapping.
+
+    Parameters
+    ----------
+    directory: str
+        Table written by save_transitions() or create_transition_files()
+    gamma, tol, stop, callback, V0:
+        as in vi_and_pi.value_iteration. The callback records also hold
+        'pages_touched', the pages of the table files mapped in by the
+        sweep (the Rss of their mappings just before they are unmapped, None
+        outside Linux), and 'major_faults', the page faults that needed disk I/O.
+    chunk_states: int
+        Number of states backed up per chunk
+    return_info: bool
+        Also return a dict with 'sweeps' and the per-sweep 'pages_touched'
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+    policy: np.ndarray[nS]
+    """
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    nS, nA, B = meta['nS'], meta['nA'], meta['B']
+
+    monitor = SweepMonitor(gamma, tol, stop, callback, backups_per_sweep=nS)
+    value_function = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+    vf2 = np.empty(nS)
+    policy = np.empty(nS, dtype=np.int64)
+    pages = []
+    while True:
+        faults = _major_faults()
+        table = load_transitions(directory)
+        for lo in range(0, nS, chunk_states):
+            hi = min(lo + chunk_states, nS)
+            next_s = table.next_s[lo:hi]
+            prob = table.prob[lo:hi].astype(np.float64)
+            reward = table.reward[lo:hi].astype(np.float64)
+            q = np.sum(prob * (reward + gamma * value_function[next_s]), axis=2)
+            vf2[lo:hi] = np.max(q, axis=1)
+            policy[lo:hi] = np.argmax(q, axis=1)
+        # Each sweep maps the files afresh, so their Rss is what it read
+        pages.append(_resident_pages(directory))
+        del table, next_s, prob, reward
+        if monitor.update(value_function, vf2, pages_touched=pages[-1],
+                          major_faults=_major_faults() - faults):
+            break
+        value_function, vf2 = vf2, value_function
+
+    value_function = monitor.estimate(value_function, vf2)
+    if return_info:
+        return value_function, policy, {'sweeps': monitor.sweeps, 'pages_touched': pages}
+    return value_function, policy
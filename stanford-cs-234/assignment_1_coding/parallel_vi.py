@@ -0,0 +1,254 @@
+"""Value iteration sharded over a process pool, with V and T in shared memory."""
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+import scipy.sparse as sp
+
+from convergence import SweepMonitor
+from mdp import as_mdp
+
+# Slots of the shared int64 control array
+BUFFER, STOP = 0, 1
+
+
+class _SharedArrays(object):
+
+    """
+    Named numpy arrays living in multiprocessing.shared_memory blocks.
+
+    The master creates them from existing arrays with create(); workers
+    re-open them from spec() with attach(). Only the creator unlinks.
+    """
+    def __init__(self):
+        self.blocks = {}
+        self.arrays = {}
+
+    def create(self, name, array):
+        array = np.ascontiguousarray(array)
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        shared[...] = array
+        self.blocks[name] = shm
+        self.arrays[name] = shared
+        return shared
+
+    def spec(self):
+        return {name: (shm.name, self.arrays[name].shape, self.arrays[name].dtype.str)
+                for name, shm in self.blocks.items()}
+
+    @classmethod
+    def attach(cls, spec):
+        shared = cls()
+        for name, (shm_name, shape, dtype) in spec.items():
+            shm = shared_memory.SharedMemory(name=shm_name)
+            shared.blocks[name] = shm
+            shared.arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        return shared
+
+    def close(self, unlink=False):
+        self.arrays.clear()
+        for shm in self.blocks.values():
+            shm.close()
+            if unlink:
+                shm.unlink()
+        self.blocks.clear()
+
+
+def _worker(spec, lo, hi, nA, gamma, shard, barrier, asynchronous):
+    """Process entry point: attach to the shared arrays and back up states lo..hi-1."""
+    shared = _SharedArrays.attach(spec)
+    try:
+        _sweep_shard(shared.arrays, lo, hi, nA, gamma, shard, barrier, asynchronous)
+    except threading.BrokenBarrierError:
+        pass # the master aborted the run
+    finally:
+        shared.close()
+
+
+def _sweep_shard(a, lo, hi, nA, gamma, shard, barrier, asynchronous):
+    """Back up states lo..hi-1 until the master sets the STOP flag."""
+    nS = a['V'].shape[1]
+    first, last = a['indptr'][lo * nA], a['indptr'][hi * nA]
+    T = sp.csr_matrix((a['data'][first:last], a['indices'][first:last],
+                       a['indptr'][lo * nA:hi * nA + 1] - first),
+                      shape=((hi - lo) * nA, nS))
+    R = a['R'][lo:hi]
+    control, V, policy, stats = a['control'], a['V'], a['policy'], a['stats']
+
+    if asynchronous:
+        # In place on V[0]: every sweep reads whatever the other shards
+        # have written so far
+        while not control[STOP]:
+            q = R + gamma * T.dot(V[0]).reshape(hi - lo, nA)
+            new = np.max(q, axis=1)
+            stats[shard, 0] = np.max(np.abs(new - V[0, lo:hi]))
+            V[0, lo:hi] = new
+            policy[lo:hi] = np.argmax(q, axis=1)
+            stats[shard, 1] += 1
+        return
+
+    while True:
+        barrier.wait() # sweep start
+        if control[STOP]:
+            return
+        V_old, V_new = V[control[BUFFER]], V[1 - control[BUFFER]]
+        q = R + gamma * T.dot(V_old).reshape(hi - lo, nA)
+        V_new[lo:hi] = np.max(q, axis=1)
+        policy[lo:hi] = np.argmax(q, axis=1)
+        stats[shard, 1] += 1
+        barrier.wait() # sweep end
+
+
+def parallel_value_iteration(P, nS, nA, gamma=0.9, tol=1e-3, n_workers=None,
+                             asynchronous=False, stop='span', callback=None,
+                             poll_interval=1e-3):
+    """
+    Value iteration with the states split into contiguous shards, one per process.
+
+    The CSR transition arrays, R, the value function and the greedy policy
+    are placed in shared memory once; workers only exchange barrier waits.
+
+    Synchronous (Jacobi) mode double-buffers V: every sweep reads V_old and
+    writes V_new, with a barrier before and after, so each sweep is exactly
+    the serial vi_and_pi.value_iteration backup and the result is identical.
+    The master applies the same stopping rule (see convergence.SweepMonitor).
+
+    Asynchronous mode lets each worker sweep its shard in place without
+    waiting for the others. Once every shard's last in-place change drops
+    below (1 - gamma) * tol, the workers stop and the master finishes with
+    serial synchronous sweeps until the stopping rule holds, so the answer
+    carries the same tol guarantee as the serial solver.
+
+    In both modes, a worker that exits early (an exception, a failed
+    shared-memory attach, an OOM kill) makes the master raise RuntimeError
+    instead of waiting for it forever.
+
+    Parameters
+    ----------
+    P, nS, nA, gamma, tol, stop, callback:
+        as in vi_and_pi.value_iteration
+    n_workers: int or None
+        Number of processes, os.cpu_count() by default
+    asynchronous: bool
+        Use asynchronous mode instead of barrier-synchronized sweeps
+    poll_interval: float
+        Seconds between convergence checks of the master in asynchronous
+        mode, and between checks that the workers are still alive
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+    policy: np.ndarray[nS]
+    """
+    mdp = as_mdp(P, nS, nA, sparse=True)
+    T = mdp.transition_csr()
+    n_workers = min(n_workers or os.cpu_count() or 1, nS)
+    bounds = np.linspace(0, nS, n_workers + 1).astype(int)
+
+    ctx = multiprocessing.get_context()
+    barrier = ctx.Barrier(n_workers + 1)
+    shared = _SharedArrays()
+    workers = []
+    try:
+        shared.create('indptr', T.indptr)
+        shared.create('indices', T.indices)
+        shared.create('data', T.data)
+        shared.create('R', mdp.R)
+        shared.create('V', np.zeros((2, nS)))
+        shared.create('policy', np.zeros(nS, dtype=np.int64))
+        shared.create('stats', np.zeros((n_workers, 2)))
+        shared.create('control', np.zeros(2, dtype=np.int64))
+
+        spec = shared.spec()
+        for shard in range(n_workers):
+            worker = ctx.Process(target=_worker, args=(
+                spec, bounds[shard], bounds[shard + 1], nA, gamma, shard,
+                barrier, asynchronous))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+        monitor = SweepMonitor(gamma, tol, stop, callback, backups_per_sweep=nS)
+        if asynchronous:
+            value_function = _wait_asynchronous(shared.arrays, workers, gamma, tol,
+                                                poll_interval)
+            monitor.backups = int(np.sum(shared.arrays['stats'][:, 1] * np.diff(bounds)))
+            while True:
+                q = mdp.q_values(value_function, gamma)
+                vf2 = np.max(q, axis=1)
+                if monitor.update(value_function, vf2):
+                    break
+                value_function = vf2
+            return monitor.estimate(value_function, vf2), np.argmax(q, axis=1)
+        return _run_synchronous(shared.arrays, workers, barrier, monitor, poll_interval)
+    finally:
+        if 'control' in shared.arrays:
+            shared.arrays['control'][STOP] = 1
+        barrier.abort()
+        for worker in workers:
+            worker.join(timeout=1)
+            if worker.is_alive():
+                worker.terminate()
+        shared.close(unlink=True)
+
+
+def _check_workers(workers):
+    """Raise RuntimeError if a worker has exited."""
+    dead = [(i, worker.exitcode) for i, worker in enumerate(workers)
+            if worker.exitcode is not None]
+    if dead:
+        raise RuntimeError('Worker processes exited early (shard, exit code): %s' % dead)
+
+
+def _watch_workers(workers, barrier, control, stopped, poll_interval):
+    """Thread body: break the barrier once a worker exits before the STOP flag."""
+    while not stopped.wait(poll_interval):
+        if not control[STOP] and any(worker.exitcode is not None for worker in workers):
+            barrier.abort()
+            return
+
+
+def _wait_asynchronous(a, workers, gamma, tol, poll_interval):
+    """Let the workers run until every shard's last change is below (1 - gamma) * tol."""
+    stats, control = a['stats'], a['control']
+    while not (np.all(stats[:, 1] > 0) and np.max(stats[:, 0]) < (1 - gamma) * tol):
+        _check_workers(workers)
+        time.sleep(poll_interval)
+    control[STOP] = 1
+    for worker in workers:
+        worker.join()
+    return a['V'][0].copy()
+
+
+def _run_synchronous(a, workers, barrier, monitor, poll_interval):
+    """Drive barrier-synchronized sweeps until the monitor says stop."""
+    V, control = a['V'], a['control']
+    stopped = threading.Event()
+    watcher = threading.Thread(target=_watch_workers,
+                               args=(workers, barrier, control, stopped, poll_interval))
+    watcher.daemon = True
+    watcher.start()
+    try:
+        while True:
+            barrier.wait() # workers start the sweep
+            barrier.wait() # workers are done
+            V_old, V_new = V[control[BUFFER]], V[1 - control[BUFFER]]
+            if monitor.update(V_old, V_new):
+                break
+            control[BUFFER] = 1 - control[BUFFER]
+        value_function = np.array(monitor.estimate(V_old, V_new))
+        policy = a['policy'].copy()
+        control[STOP] = 1
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        _check_workers(workers)
+        raise
+    finally:
+        stopped.set()
+        watcher.join()
+    for worker in workers:
+        worker.join()
+    return value_function, policy
@@ -0,0 +1,138 @@
+"""Headless evaluation of a policy: goal probability, discounted return and episode length."""
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph as csgraph
+import scipy.sparse.linalg as spla
+
+from discrete_env import TransitionTable
+from vector_env import VectorDiscreteEnv
+
+
+def _transition_table(env):
+    table = getattr(env, 'transitions', None)
+    if table is None:
+        table = TransitionTable.from_P(env.P, env.nS, env.nA)
+    return table
+
+
+def _solve(A, b, states):
+    """Solve A[states, states] x = b[states]; zero outside states."""
+    x = np.zeros(A.shape[0])
+    if len(states):
+        x[states] = spla.spsolve(A[states][:, states].tocsc(), b[states])
+    return x
+
+
+def evaluate_policy(env, policy, gamma=0.9):
+    """
+    Exact episode statistics of a deterministic policy via absorbing-chain solves.
+
+    An episode ends on a transition flagged done. Writing Q for the policy's
+    transitions that do not end the episode, the statistics solve
+        (I - Q) x = Pr(reaching the goal in one step)      success probability
+        (I - gamma Q) G = r_pi                              discounted return
+        (I - Q) L = 1                                       episode length
+    The first two are restricted to states from which an episode can end, so
+    they stay non-singular when the policy walks into a loop that never
+    terminates. Such states get success probability 0, and every state whose
+    episode ends with probability < 1 gets an infinite expected length.
+    The goal is any done transition with positive reward.
+
+    Parameters
+    ----------
+    env: discrete_env.DiscreteEnv or gym FrozenLakeEnv
+        Must have nS, nA, P (or transitions) and isd
+    policy: np.ndarray[nS]
+    gamma: float
+        Discount factor in [0, 1) for the expected return
+    Returns
+    -------
+    metrics: dict
+        'success_probability', 'expected_return' and 'expected_length' for
+        an episode started from isd, and the per-state arrays
+        'success_by_state', 'return_by_state' and 'length_by_state'
+    """
+    table = _transition_table(env)
+    nS, B = table.nS, table.B
+    states = np.arange(nS)
+    policy = np.asarray(policy)
+
+    next_s = table.next_s[states, policy].astype(np.int64)
+    prob = table.prob[states, policy].astype(np.float64)
+    reward = table.reward[states, policy].astype(np.float64)
+    done = table.done[states, policy]
+
+    rows = np.repeat(states, B)
+    cont = prob * ~done
+    Q = sp.csr_matrix((cont.ravel(), (rows, next_s.ravel())), shape=(nS, nS))
+    I = sp.identity(nS, format='csr')
+    goal_step = np.sum(prob * (done & (reward > 0)), axis=1)
+    end_step = np.sum(prob * done, axis=1)
+    r_pi = np.sum(prob * reward, axis=1)
+
+    # States that can reach a terminating transition: BFS on the reversed
+    # chain from a virtual node nS linked to every state with end_step > 0
+    reverse = sp.bmat([[Q.T, None], [sp.csr_matrix(end_step[None]), None]], format='csr')
+    reverse = sp.hstack([reverse, sp.csr_matrix((nS + 1, 1))], format='csr')
+    can_end = csgraph.breadth_first_order(reverse, nS, directed=True,
+                                          return_predecessors=False)
+    can_end = np.sort(can_end[can_end != nS])
+
+    A = I - Q
+    success = _solve(A, goal_step, can_end)
+    ends = _solve(A, end_step, can_end)
+    sure = np.flatnonzero(ends >= 1 - 1e-9)
+    length = np.full(nS, np.inf)
+    length[sure] = _solve(A, np.ones(nS), sure)[sure]
+    discounted = spla.spsolve((I - gamma * Q).tocsc(), r_pi)
+
+    isd = np.asarray(env.isd, dtype=np.float64)
+    start = np.flatnonzero(isd)
+    return {
+        'success_probability': float(isd.dot(success)),
+        'expected_return': float(isd.dot(discounted)),
+        'expected_length': float(isd[start].dot(length[start])),
+        'success_by_state': success,
+        'return_by_state': discounted,
+        'length_by_state': length,
+    }
+
+
+def monte_carlo_evaluate(env, policy, gamma=0.9, n_episodes=10000, max_steps=1000,
+                         seed=None):
+    """
+    Estimate the statistics of evaluate_policy() by simulating n_episodes at once.
+
+    Episodes run in a VectorDiscreteEnv, one copy per episode, for at most
+    max_steps steps. Each mean comes with its standard error ('*_stderr').
+    'truncated' is the fraction of episodes cut off at max_steps; those
+    count as failures and their lengths are excluded from 'expected_length'.
+    """
+    venv = VectorDiscreteEnv(env, n_episodes, seed)
+    policy = np.asarray(policy)
+    running = np.ones(n_episodes, dtype=bool)
+    success = np.zeros(n_episodes)
+    discounted = np.zeros(n_episodes)
+    length = np.zeros(n_episodes)
+    s = venv.reset()
+    for t in range(max_steps):
+        s, reward, done, _ = venv.step(policy[s])
+        discounted += running * gamma ** t * reward
+        length += running
+        success += running & done & (reward > 0)
+        running &= ~done
+        if not running.any():
+            break
+
+    finished = ~running
+    sqrt_n = np.sqrt(n_episodes)
+    return {
+        'success_probability': float(success.mean()),
+        'success_probability_stderr': float(success.std() / sqrt_n),
+        'expected_return': float(discounted.mean()),
+        'expected_return_stderr': float(discounted.std() / sqrt_n),
+        'expected_length': float(length[finished].mean()) if finished.any() else np.inf,
+        'expected_length_stderr': (float(length[finished].std() / np.sqrt(finished.sum()))
+                                   if finished.any() else np.inf),
+        'truncated': float(running.mean()),
+    }
@@ -0,0 +1,87 @@
+"""Solve only the states an episode can actually visit."""
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph as csgraph
+
+from mdp import TabularMDP, compile_mdp, transition_graph
+
+
+def reachable_states(mdp, isd):
+    """
+    Sorted indices of the states reachable from the support of isd.
+
+    Breadth-first search over the transition graph, where s -> s' if
+    T[s, a, s'] > 0 for some action a, from a virtual node linked to every
+    state with isd > 0.
+    """
+    nS = mdp.nS
+    start = np.flatnonzero(np.asarray(isd) > 0)
+    # Nodes 0..nS-1 are the states, node nS the virtual source
+    source = sp.csr_matrix((np.ones(len(start)), (np.zeros(len(start)), start)),
+                           shape=(1, nS))
+    graph = sp.bmat([[transition_graph(mdp), None], [source, None]], format='csr')
+    graph = sp.hstack([graph, sp.csr_matrix((nS + 1, 1))], format='csr')
+    order = csgraph.breadth_first_order(graph, nS, directed=True,
+                                        return_predecessors=False)
+    return np.sort(order[order != nS])
+
+
+def restrict_mdp(mdp, states):
+    """
+    The MDP on a subset of states closed under transitions.
+
+    Reduced state i is original state states[i]. states must contain every
+    successor of its members, as reachable_states() guarantees; otherwise
+    probability mass leaving the subset would be dropped.
+    """
+    states = np.asarray(states)
+    if mdp.sparse:
+        rows = (states[:, None] * mdp.nA + np.arange(mdp.nA)).ravel()
+        T = mdp.T[rows][:, states]
+    else:
+        T = mdp.T[states][:, :, states]
+    return TabularMDP(len(states), mdp.nA, T, mdp.R[states])
+
+
+def compile_reachable(env, sparse=False):
+    """
+    Compile env and restrict it to the states reachable from env.isd.
+
+    Returns
+    -------
+    mdp: TabularMDP
+        The reduced MDP
+    states: np.ndarray[int]
+        Original index of every reduced state
+    """
+    if hasattr(env, 'compile'):
+        full = env.compile(sparse)
+    else:
+        full = compile_mdp(env.P, env.nS, env.nA, sparse)
+    states = reachable_states(full, env.isd)
+    return restrict_mdp(full, states), states
+
+
+def solve_reachable(solver, env, *args, **kwargs):
+    """
+    Run solver(P, nS, nA, *args, **kwargs) on the reachable part of env only.
+
+    solver is any function of the vi_and_pi signature returning
+    (value_function, policy, ...), e.g. vi_and_pi.value_iteration or
+    async_vi.prioritized_sweeping. The value function and policy are
+    scattered back to arrays of size env.nS, with NaN values and action 0
+    in unreachable states; anything else the solver returns is passed on
+    unchanged. Pass sparse=True to compile the reduced MDP in CSR form.
+
+    Returns
+    -------
+    value_function: np.ndarray[env.nS]
+    policy: np.ndarray[env.nS]
+    """
+    mdp, states = compile_reachable(env, kwargs.pop('sparse', False))
+    result = solver(mdp, mdp.nS, mdp.nA, *args, **kwargs)
+    value_function = np.full(env.nS, np.nan)
+    value_function[states] = result[0]
+    policy = np.zeros(env.nS, dtype=np.asarray(result[1]).dtype)
+    policy[states] = result[1]
+    return (value_function, policy) + tuple(result[2:])
@@ -0,0 +1,117 @@
+"""On-disk cache of solved value functions and policies, with warm starts across gammas."""
+import glob
+import os
+
+import numpy as np
+
+from mdp import as_mdp
+from vi_and_pi import policy_iteration, value_iteration
+
+
+class SolverCache(object):
+
+    """
+    Directory of .npz files, one per solved (MDP, solver, gamma, tol).
+
+    Files are named <mdp hash>-<solver>-g<gamma>-t<tol>.npz, where the hash
+    is TabularMDP.content_hash(), and hold 'value_function', 'policy',
+    'gamma' and 'tol'. <solver> names the solver together with the options
+    that change its answer, e.g. 'value_iteration-span'.
+    """
+    def __init__(self, directory='solver_cache'):
+        self.directory = directory
+
+    def path(self, mdp, solver, gamma, tol):
+        name = '%s-%s-g%r-t%r.npz' % (mdp.content_hash(), solver, float(gamma), float(tol))
+        return os.path.join(self.directory, name)
+
+    def load(self, mdp, solver, gamma, tol):
+        """Return (value_function, policy) for an exact hit, else None."""
+        path = self.path(mdp, solver, gamma, tol)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return data['value_function'], data['policy']
+
+    def save(self, mdp, solver, gamma, tol, value_function, policy):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(mdp, solver, gamma, tol)
+        tmp = path[:-len('.npz')] + '.tmp.npz'
+        np.savez(tmp, value_function=value_function, policy=policy,
+                 gamma=gamma, tol=tol)
+        os.replace(tmp, path)
+
+    def nearest(self, mdp, gamma):
+        """
+        Cached solution of the same MDP, from any solver, whose gamma is
+        closest to the given one. Returns (value_function, policy, gamma)
+        or None if the MDP was never solved.
+        """
+        pattern = os.path.join(glob.escape(self.directory), mdp.content_hash() + '-*.npz')
+        best = None
+        for path in glob.glob(pattern):
+            if path.endswith('.tmp.npz'):
+                continue
+            with np.load(path) as data:
+                distance = abs(float(data['gamma']) - gamma)
+                if best is None or distance < best[0]:
+                    best = (distance, data['value_function'], data['policy'],
+                            float(data['gamma']))
+        return None if best is None else best[1:]
+
+
+def cached_value_iteration(P, nS, nA, gamma=0.9, tol=1e-3, cache=None,
+                           return_info=False, **kwargs):
+    """
+    vi_and_pi.value_iteration backed by a SolverCache.
+
+    An exact hit is returned without solving. Otherwise the solver starts
+    from the cached value function of the nearest gamma for the same MDP,
+    and the new result is stored. Extra keyword arguments go to
+    value_iteration; results are cached per stopping rule (stop=), since
+    each gives a different guarantee. return_info=True also returns a dict
+    with 'hit' ('exact', 'warm' or 'miss').
+    """
+    return _cached_solve('value_iteration', P, nS, nA, gamma, tol, cache,
+                         return_info, kwargs)
+
+
+def cached_policy_iteration(P, nS, nA, gamma=0.9, tol=10e-3, cache=None,
+                            return_info=False, **kwargs):
+    """
+    vi_and_pi.policy_iteration backed by a SolverCache, see
+    cached_value_iteration(). Results are cached per evaluation method and
+    stopping rule (method=, stop=). Warm starts use the cached policy of the
+    nearest gamma as the initial policy.
+    """
+    return _cached_solve('policy_iteration', P, nS, nA, gamma, tol, cache,
+                         return_info, kwargs)
+
+
+def _cached_solve(solver, P, nS, nA, gamma, tol, cache, return_info, kwargs):
+    mdp = as_mdp(P, nS, nA)
+    cache = SolverCache() if cache is None else cache
+    # Options that change the answer are part of the key; V0 and policy0
+    # only change the starting point, not the guarantee of the result
+    key = '%s-%s' % (solver, kwargs.get('stop', 'span'))
+    if solver == 'policy_iteration':
+        key = '%s-%s' % (key, kwargs.get('method', 'iterative'))
+
+    result = cache.load(mdp, key, gamma, tol)
+    hit = 'exact'
+    if result is None:
+        nearest = cache.nearest(mdp, gamma)
+        hit = 'miss' if nearest is None else 'warm'
+        if solver == 'value_iteration':
+            if nearest is not None:
+                kwargs.setdefault('V0', nearest[0])
+            result = value_iteration(mdp, nS, nA, gamma, tol, **kwargs)
+        else:
+            if nearest is not None:
+                kwargs.setdefault('policy0', nearest[1])
+            result = policy_iteration(mdp, nS, nA, gamma, tol, **kwargs)
+        cache.save(mdp, key, gamma, tol, *result)
+
+    if return_info:
+        return result[0], result[1], {'hit': hit}
+    return result
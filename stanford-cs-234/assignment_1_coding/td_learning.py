@@ -0,0 +1,102 @@
+"""Model-free tabular TD learning on many DiscreteEnv copies at once."""
+import time
+
+import numpy as np
+
+from vector_env import VectorDiscreteEnv
+
+TD_ALGORITHMS = ('q_learning', 'sarsa', 'expected_sarsa')
+
+
+def epsilon_greedy(Q, states, epsilon, np_random):
+    """
+    One epsilon-greedy action per entry of states.
+
+    Each entry is uniformly random with probability epsilon and
+    argmax_a Q[s, a] otherwise.
+    """
+    nA = Q.shape[1]
+    greedy = np.argmax(Q[states], axis=1)
+    explore = np_random.rand(len(states)) < epsilon
+    return np.where(explore, np_random.randint(nA, size=len(states)), greedy)
+
+
+def td_learning(env, num_envs=1024, n_steps=1000, algorithm='q_learning', gamma=0.9,
+                alpha=0.1, epsilon=0.1, Q0=None, seed=None, return_info=False):
+    """
+    Learn Q by running num_envs copies of env in lockstep.
+
+    Every step, all copies act epsilon-greedily with respect to the shared
+    Q table and one TD update is applied per copy. Updates that hit the same
+    (s, a) in one step are averaged rather than summed: num_envs copies start
+    in the same state, and summing would make the effective step size
+    num_envs * alpha.
+
+    Parameters
+    ----------
+    env: discrete_env.DiscreteEnv
+        Environment to copy (anything VectorDiscreteEnv accepts)
+    num_envs: int
+        Number of copies stepped together
+    n_steps: int
+        Number of batched steps, so num_envs * n_steps transitions in total
+    algorithm: str
+        'q_learning' bootstraps on max_a Q[s', a], 'sarsa' on Q[s', a'] with
+        a' the action taken next, 'expected_sarsa' on the expectation of
+        Q[s', .] under the epsilon-greedy policy
+    gamma, alpha, epsilon: float
+        Discount factor, step size and exploration rate
+    Q0: np.ndarray[nS, nA] or None
+        Initial Q table, zeros by default
+    seed: int or None
+        Seed of the environment and action RNG
+    return_info: bool
+        Also return a dict with 'transitions', 'episodes', 'elapsed' and
+        'updates_per_sec'
+    Returns
+    -------
+    Q: np.ndarray[nS, nA]
+    """
+    if algorithm not in TD_ALGORITHMS:
+        raise ValueError('Unknown TD algorithm: %s' % algorithm)
+    venv = VectorDiscreteEnv(env, num_envs, seed)
+    rng = venv.np_random
+    nS, nA = venv.nS, venv.nA
+    Q = np.zeros((nS, nA)) if Q0 is None else np.array(Q0, dtype=float)
+
+    start = time.time()
+    episodes = 0
+    s = venv.reset()
+    a = epsilon_greedy(Q, s, epsilon, rng)
+    for _ in range(n_steps):
+        obs, r, done, info = venv.step(a)
+        next_s = info['next_state']
+        a_next = epsilon_greedy(Q, obs, epsilon, rng)
+
+        if algorithm == 'q_learning':
+            bootstrap = np.max(Q[next_s], axis=1)
+        elif algorithm == 'sarsa':
+            # Where done, obs was reset and a_next belongs to the new episode,
+            # but the bootstrap term is masked out below anyway
+            bootstrap = Q[next_s, a_next]
+        else:
+            q_next = Q[next_s]
+            bootstrap = (epsilon * np.mean(q_next, axis=1)
+                         + (1 - epsilon) * np.max(q_next, axis=1))
+        td_error = r + gamma * np.where(done, 0., bootstrap) - Q[s, a]
+
+        # Scatter the per-copy updates into Q, averaging duplicates
+        index = s * nA + a
+        total = np.bincount(index, weights=td_error, minlength=nS * nA)
+        count = np.bincount(index, minlength=nS * nA)
+        Q += alpha * (total / np.maximum(count, 1)).reshape(nS, nA)
+
+        episodes += np.count_nonzero(done)
+        s, a = obs, a_next
+
+    if return_info:
+        elapsed = time.time() - start
+        transitions = num_envs * n_steps
+        return Q, {'transitions': transitions, 'episodes': episodes, 'elapsed': elapsed,
+                   'updates_per_sec': transitions / elapsed if elapsed > 0 else float('inf')}
+    return Q
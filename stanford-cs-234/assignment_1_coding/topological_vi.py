@@ -0,0 +1,132 @@
+"""Topological value iteration: solve strongly connected components one layer at a time."""
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.csgraph as csgraph
+
+from convergence import SweepMonitor
+from mdp import as_mdp, transition_graph
+
+
+def component_layers(mdp):
+    """
+    Strongly connected components of the transition graph, grouped into layers.
+
+    Layer 0 holds the components with no successor outside themselves, and
+    every other component sits one layer above its highest successor. The
+    components of a layer therefore only depend on each other through
+    lower layers, which are final by the time the layer is solved.
+
+    Returns
+    -------
+    label: np.ndarray[nS]
+        Component of every state
+    layer: np.ndarray[n_components]
+        Layer of every component
+    """
+    G = transition_graph(mdp).tocoo()
+    n, label = csgraph.connected_components(G, directed=True, connection='strong')
+    between = label[G.row] != label[G.col]
+    # Condensation, stored reversed: row c lists the components leading into c
+    dag = sp.csr_matrix((np.ones(np.count_nonzero(between)),
+                         (label[G.col[between]], label[G.row[between]])), shape=(n, n))
+    dag.sum_duplicates()
+    dag.data[:] = 1.
+    pending = np.asarray(dag.sum(axis=0)).ravel().astype(np.int64) # successors left
+
+    layer = np.zeros(n, dtype=np.int64)
+    frontier = np.flatnonzero(pending == 0)
+    depth = 0
+    while len(frontier):
+        layer[frontier] = depth
+        preds = dag[frontier].indices
+        np.subtract.at(pending, preds, 1)
+        frontier = np.unique(preds[pending[preds] == 0])
+        depth += 1
+    return label, layer
+
+
+def topological_value_iteration(P, nS, nA, gamma=0.9, tol=1e-3, callback=None,
+                                return_info=False):
+    """
+    Value iteration one layer of strongly connected components at a time.
+
+    Components are solved from the sinks up (see component_layers()), each
+    from the already final values of its successors, so sweeps only touch
+    the states that still change. A state that is a component on its own
+    gets exactly one backup: with p_a its probability of staying put under
+    action a and W_a the backup that leaves it, V = max_a W_a / (1 - gamma p_a).
+    The larger components of a layer are swept together until
+    gamma / (1 - gamma) * max |V_new - V_old| < tol, which puts them within
+    tol of their values given the successors'.
+
+    Probability leaves a component, so its transitions are substochastic
+    and the span rule of convergence.SweepMonitor does not apply: a
+    component whose values all rise by the same amount has span 0 without
+    having converged. Errors of the successors reach a component damped by
+    gamma, so k layers up values are within tol (1 - gamma ** k) / (1 - gamma).
+
+    Parameters
+    ----------
+    P, nS, nA, gamma:
+        as in vi_and_pi.py
+    tol: float
+        Per-component tolerance, see above
+    callback:
+        as in vi_and_pi.value_iteration, called for each sweep of a layer's
+        larger components; records also hold the 'layer'. Their 'bound' is
+        the span bound, which does not decide when to stop here.
+    return_info: bool
+        Also return a dict with the number of 'components', 'layers' and
+        single-state 'backups'.
+    Returns
+    -------
+    value_function: np.ndarray[nS]
+    policy: np.ndarray[nS]
+    """
+    mdp = as_mdp(P, nS, nA, sparse=True)
+    T = mdp.transition_csr()
+    if not T.has_canonical_format:
+        # Element lookups below need duplicate (s, a, s') entries summed
+        T = T.copy()
+        T.sum_duplicates()
+    label, layer = component_layers(mdp)
+    size = np.bincount(label)
+    single = size[label] == 1
+    state_layer = layer[label]
+    order = np.argsort(state_layer, kind='stable')
+    starts = np.searchsorted(state_layer[order], np.arange(layer.max() + 2))
+
+    V = np.zeros(nS)
+    backups = 0
+    for depth in range(len(starts) - 1):
+        states = order[starts[depth]:starts[depth + 1]]
+
+        # Singleton components, in closed form; V[s] is still 0 here, so
+        # T_rows V only holds the mass that leaves s
+        s = states[single[states]]
+        if len(s):
+            rows = (s[:, None] * nA + np.arange(nA)).ravel()
+            stay = np.asarray(T[rows, np.repeat(s, nA)]).reshape(len(s), nA)
+            leave = mdp.R[s] + gamma * T[rows].dot(V).reshape(len(s), nA)
+            V[s] = np.max(leave / (1. - gamma * stay), axis=1)
+            backups += len(s)
+
+        s = states[~single[states]]
+        if len(s):
+            rows = (s[:, None] * nA + np.arange(nA)).ravel()
+            T_rows, R = T[rows], mdp.R[s]
+            monitor = SweepMonitor(gamma, (1. - gamma) / gamma * tol, 'sup', callback,
+                                   backups_per_sweep=len(s))
+            while True:
+                new = np.max(R + gamma * T_rows.dot(V).reshape(len(s), nA), axis=1)
+                old = V[s]
+                V[s] = new
+                if monitor.update(old, new, layer=depth):
+                    break
+            backups += monitor.backups
+
+    policy = np.argmax(mdp.q_values(V, gamma), axis=1)
+    if return_info:
+        return V, policy, {'components': len(size), 'layers': len(starts) - 1,
+                           'backups': backups}
+    return V, policy
@@ -0,0 +1,72 @@
+"""Step many copies of a DiscreteEnv at once with NumPy."""
+import numpy as np
+
+from gym.utils import seeding
+
+from discrete_env import TransitionTable
+
+
+class VectorDiscreteEnv(object):
+
+    """
+    N independent copies of a DiscreteEnv advanced together.
+
+    Has the following members
+    - num_envs: number of copies N
+    - nS, nA: as in DiscreteEnv
+    - s: current states, int array of shape (N,)
+
+    Copies that reach a terminal state are reset from isd inside step().
+    Outcomes are drawn from discrete_env.AliasTable, one uniform per copy.
+    Resets search the CDF of isd instead: an alias table over nS outcomes
+    takes O(nS ** 2) to build, the CDF O(nS).
+    """
+    def __init__(self, env, num_envs, seed=None):
+        table = getattr(env, 'transitions', None)
+        if table is None:
+            table = TransitionTable.from_P(env.P, env.nS, env.nA)
+        self.num_envs = num_envs
+        self.nS, self.nA = env.nS, env.nA
+        self.next_s = table.next_s
+        self.reward = table.reward
+        self.done = table.done
+        self.outcomes = table.alias_table()
+        self.isd_cdf = np.cumsum(env.isd)
+        self.seed(seed)
+        self.reset()
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def _sample_isd(self, n):
+        return np.searchsorted(self.isd_cdf, self.np_random.rand(n), side='right')
+
+    def reset(self):
+        self.s = self._sample_isd(self.num_envs)
+        return self.s.copy()
+
+    def step(self, actions):
+        """
+        Take actions[i] in copy i.
+
+        Returns
+        -------
+        obs: np.ndarray[N]
+            State of each copy after the step, reset from isd where done
+        reward: np.ndarray[N]
+        done: np.ndarray[N] of bool
+        info: dict
+            'next_state': the successor states before any reset
+        """
+        s, a = self.s, np.asarray(actions)
+        i = self.outcomes.sample((s, a), self.np_random)
+        next_s = self.next_s[s, a, i]
+        reward = self.reward[s, a, i]
+        done = self.done[s, a, i]
+
+        self.s = next_s.astype(np.int64)
+        n_done = np.count_nonzero(done)
+        if n_done:
+            self.s[done] = self._sample_isd(n_done)
+        return self.s.copy(), reward, done, {'next_state': next_s}
@@ -1,9 +1,14 @@
 ### MDP Value Iteration and Policy Iteration
 import argparse
 import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
 import gym
 import time
 from lake_envs import *
+from mdp import as_mdp, compile_mdp
+from convergence import SweepMonitor
+from policy_metrics import evaluate_policy
 
 np.set_printoptions(precision=3)
 
@@ -15,15 +20,17 @@ parser.add_argument("--env",
 					help="The name of the environment to run your algorithm on.", 
 					choices=["Deterministic-4x4-FrozenLake-v0","Stochastic-4x4-FrozenLake-v0"],
 					default="Deterministic-4x4-FrozenLake-v0")
+parser.add_argument("--render", action="store_true",
+					help="Watch one rendered episode of each policy instead of only printing its exact statistics.")
 
 """
 For policy_evaluation, policy_improvement, policy_iteration and value_iteration,
 the parameters P, nS, nA, gamma are defined as follows:
 
-	P: nested dictionary
+	P: nested dictionary or mdp.TabularMDP
 		From gym.core.Environment
 		For each pair of states in [1, nS] and actions in [1, nA], P[state][action] is a
-		tuple of the form (probability, nextstate, reward, terminal) where
+		list of tuples of the form (probability, nextstate, reward, terminal) where
 			- probability: float
 				the probability of transitioning from "state" to "nextstate" with "action"
 			- nextstate: int
@@ -33,18 +40,81 @@ the parameters P, nS, nA, gamma are defined as follows:
 				"nextstate" with "action"
 			- terminal: bool
 			  True when "nextstate" is a terminal state (hole or goal), False otherwise
+		The solvers compile P into dense arrays with mdp.compile_mdp(). Pass
+		the compiled TabularMDP instead of the dictionary to reuse it across calls,
+		and compile with sparse=True for maps too large for an (nS, nA, nS) tensor.
 	nS: int
 		number of states in the environment
 	nA: int
 		number of actions in the environment
 	gamma: float
 		Discount factor. Number in range [0, 1)
+
+The iterative solvers also take
+	tol, stop: float, str
+		Stopping rule, see convergence.SweepMonitor. The default 'span' rule
+		stops once gamma / (1 - gamma) * sp(V_new - V_old) < tol, where sp is
+		the span max - min. The returned policy is then tol-optimal in every
+		state, and the returned values are within tol / 2 of the fixed point.
+	callback: callable or None
+		Called after every sweep with a telemetry dict (residual, span, bound,
+		backups, elapsed, backups_per_sec); convergence.SolverTrace records them.
 """
 
-def calculate_value(r, g, p, nv):
-	return r + g * p * nv
+KRYLOV_SOLVERS = {
+	'gmres': spla.gmres,
+	'bicgstab': spla.bicgstab,
+}
+EVALUATION_METHODS = ['iterative', 'direct'] + sorted(KRYLOV_SOLVERS)
+
+def solve_policy_system(P_pi, r_pi, gamma, method='direct', tol=1e-3):
+	"""Solve (I - gamma P_pi) V = r_pi for the value of a fixed policy.
 
-def policy_evaluation(P, nS, nA, policy, gamma=0.9, tol=1e-3):
+	Parameters
+	----------
+	P_pi: np.ndarray[nS, nS] or scipy.sparse matrix
+		Transition matrix of the policy
+	r_pi: np.ndarray[nS]
+		Expected reward of the policy in each state
+	method: str
+		'direct' factorizes the system (LU, sparse LU for sparse P_pi).
+		'gmres' and 'bicgstab' are Krylov solvers for large systems. Plain
+		conjugate gradient needs a symmetric system, which I - gamma P_pi is not,
+		so BiCGSTAB is the conjugate-gradient variant offered here.
+	tol: float
+		Krylov solvers stop once ||(I - gamma P_pi) V - r_pi||_2 < (1 - gamma) * tol,
+		which bounds max |V(s) - V_pi(s)| by tol.
+	Returns
+	-------
+	value_function: np.ndarray[nS]
+	iterations: int
+		Krylov iterations, or 1 for the direct solve
+	"""
+	nS = len(r_pi)
+	if sp.issparse(P_pi):
+		A = (sp.identity(nS, format='csr') - gamma * P_pi).tocsc()
+	else:
+		A = np.eye(nS) - gamma * P_pi
+
+	if method == 'direct':
+		if sp.issparse(A):
+			return spla.spsolve(A, r_pi), 1
+		return np.linalg.solve(A, r_pi), 1
+
+	if method not in KRYLOV_SOLVERS:
+		raise ValueError('Unknown policy evaluation method: %s' % method)
+	counter = [0]
+	def count(_):
+		counter[0] += 1
+	kwargs = {'callback_type': 'pr_norm'} if method == 'gmres' else {}
+	value_function, status = KRYLOV_SOLVERS[method](
+		A, r_pi, rtol=0., atol=(1 - gamma) * tol, callback=count, **kwargs)
+	if status < 0:
+		raise ValueError('%s failed on the policy evaluation system' % method)
+	return value_function, counter[0]
+
+def policy_evaluation(P, nS, nA, policy, gamma=0.9, tol=1e-3, method='iterative',
+		return_info=False, stop='span', callback=None, V0=None):
 	"""Evaluate the value function from a given policy.
 
 	Parameters
@@ -53,9 +123,17 @@ def policy_evaluation(P, nS, nA, policy, gamma=0.9, tol=1e-3):
 		defined at beginning of file
 	policy: np.array[nS]
 		The policy to evaluate. Maps states to actions.
-	tol: float
-		Terminate policy evaluation when
-			max |value_function(s) - prev_value_function(s)| < tol
+	tol, stop, callback:
+		defined at beginning of file; only used by the 'iterative' method
+	method: str
+		'iterative' runs fixed-point sweeps. 'direct', 'gmres' and 'bicgstab'
+		solve (I - gamma P_pi) V = r_pi, see solve_policy_system().
+	return_info: bool
+		Also return a dict with the number of 'iterations' (sweeps or Krylov
+		iterations) and the final 'residual' max |r_pi + gamma P_pi V - V|.
+	V0: np.ndarray[nS] or None
+		Starting point of the 'iterative' method, zeros by default. The value
+		function of a previous, similar policy saves most of the sweeps.
 	Returns
 	-------
 	value_function: np.ndarray[nS]
@@ -63,24 +141,32 @@ def policy_evaluation(P, nS, nA, policy, gamma=0.9, tol=1e-3):
 		the value of state s
 	"""
 
-	value_function = np.zeros(nS)
-
-	############################
-	# # YOUR IMPLEMENTATION HERE #
-	diff = 1
-	while diff > tol:
-		vf2 = np.zeros_like(value_function)
-		for i in range(len(policy)):
-			probability, nextstate, reward, _ = P[i][policy[i]][0]
-			vf2[i] = calculate_value(reward, gamma, probability, value_function[nextstate])
-		diff = np.sum(np.abs(value_function - vf2))
-		# print('value change %f' % (value_change))
-		value_function = vf2
-	############################
+	mdp = as_mdp(P, nS, nA)
+	P_pi, r_pi = mdp.policy_model(policy)
+
+	if method == 'iterative':
+		monitor = SweepMonitor(gamma, tol, stop, callback, backups_per_sweep=nS)
+		value_function = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+		############################
+		# # YOUR IMPLEMENTATION HERE #
+		while True:
+			vf2 = r_pi + gamma * P_pi.dot(value_function)
+			if monitor.update(value_function, vf2):
+				value_function = monitor.estimate(value_function, vf2)
+				break
+			value_function = vf2
+		############################
+		iterations = monitor.sweeps
+	else:
+		value_function, iterations = solve_policy_system(P_pi, r_pi, gamma, method, tol)
+
+	if return_info:
+		residual = float(np.max(np.abs(r_pi + gamma * P_pi.dot(value_function) - value_function)))
+		return value_function, {'iterations': iterations, 'residual': residual}
 	return value_function
 
 
-def policy_improvement(P, nS, nA, value_from_policy, policy, gamma=0.9):
+def policy_improvement(P, nS, nA, value_from_policy, policy, gamma=0.9, tie_tol=0.):
 	"""Given the value function from policy improve the policy.
 
 	Parameters
@@ -91,6 +177,10 @@ def policy_improvement(P, nS, nA, value_from_policy, policy, gamma=0.9):
 		The value calculated from the policy
 	policy: np.array
 		The previous policy.
+	tie_tol: float
+		Keep the previous action of a state when its value is within tie_tol
+		of the best action. With approximate evaluation, near-ties would
+		otherwise flip back and forth between iterations.
 
 	Returns
 	-------
@@ -100,22 +190,20 @@ def policy_improvement(P, nS, nA, value_from_policy, policy, gamma=0.9):
 		given value function.
 	"""
 
-	new_policy = np.zeros(nS, dtype='int')
-
 	############################
 	# YOUR IMPLEMENTATION HERE #
-	for s in range(nS):
-		action_values = []
-		for a in range(nA):
-			probability, nextstate, reward, _ = P[s][a][0]
-			v = calculate_value(reward, gamma, probability, value_from_policy[nextstate])
-			action_values.append(v)
-		new_policy[s] = np.argmax(action_values)
+	mdp = as_mdp(P, nS, nA)
+	q = mdp.q_values(value_from_policy, gamma)
+	new_policy = np.argmax(q, axis=1)
+	if policy is not None:
+		keep = q[np.arange(nS), policy] >= q[np.arange(nS), new_policy] - tie_tol
+		new_policy[keep] = np.asarray(policy)[keep]
 	############################
 	return new_policy
 
 
-def policy_iteration(P, nS, nA, gamma=0.9, tol=10e-3):
+def policy_iteration(P, nS, nA, gamma=0.9, tol=10e-3, method='iterative', stop='span',
+		callback=None, policy0=None):
 	"""Runs policy iteration.
 
 	You should call the policy_evaluation() and policy_improvement() methods to
@@ -127,29 +215,102 @@ def policy_iteration(P, nS, nA, gamma=0.9, tol=10e-3):
 		defined at beginning of file
 	tol: float
 		tol parameter used in policy_evaluation()
+	method, stop, callback: str, str, callable
+		parameters passed on to policy_evaluation(). With method='iterative'
+		the evaluations are only tol-accurate, so an action is only replaced
+		when it is more than gamma * tol worse; this stops policies from cycling
+		on evaluation noise, but the returned policy is then only within
+		gamma * tol / (1 - gamma) of optimal. The linear-solve methods
+		replace every action that is worse at all.
+	policy0: np.ndarray[nS] or None
+		Initial policy, all zeros by default
 	Returns:
 	----------
 	value_function: np.ndarray[nS]
 	policy: np.ndarray[nS]
 	"""
 
+	mdp = as_mdp(P, nS, nA)
 	value_function = np.zeros(nS)
-	policy = np.zeros(nS, dtype=int)
+	policy = np.zeros(nS, dtype=int) if policy0 is None else np.array(policy0, dtype=int)
+	tie_tol = gamma * tol if method == 'iterative' else 0.
 
 	############################
 	# YOUR IMPLEMENTATION HERE #
 	diff = 1
 	while diff != 0:
 		# Iterate policy eval & improvement
-		value_function = policy_evaluation(P, nS, nA, policy, gamma, tol)
-		new_policy = policy_improvement(P, nS, nA, value_function, policy, gamma)
+		# Warm-start each evaluation from the previous policy's values
+		value_function = policy_evaluation(mdp, nS, nA, policy, gamma, tol, method,
+				stop=stop, callback=callback, V0=value_function)
+		new_policy = policy_improvement(mdp, nS, nA, value_function, policy, gamma,
+				tie_tol=tie_tol)
 		diff = (new_policy != policy).sum()
 		print(f'policy changed in {diff} states')
 		policy = new_policy
 	############################
 	return value_function, policy
 
-def value_iteration(P, nS, nA, gamma=0.9, tol=1e-3):
+def modified_policy_iteration(P, nS, nA, gamma=0.9, tol=1e-3, k='adaptive', stop='span',
+		callback=None, V0=None, max_partial_sweeps=100):
+	"""
+	Modified policy iteration: greedy improvement followed by k partial
+	evaluation sweeps of the new policy, warm-started from the current values.
+
+	k=0 is value iteration and k=infinity is policy iteration; in between, the
+	improvement step propagates values like value iteration while the cheap
+	policy sweeps (one action per state) do most of the work. The stopping rule
+	is applied to the improvement steps, which are exact Bellman backups, so it
+	gives the same guarantee as in value_iteration().
+
+	Parameters
+	----------
+	P, nS, nA, gamma:
+		defined at beginning of file
+	tol, stop, callback:
+		defined at beginning of file; callback is called once per improvement
+		step and its 'backups' include the partial evaluation sweeps
+	k: int or 'adaptive'
+		Number of partial evaluation sweeps per improvement. 'adaptive' sweeps
+		until the evaluation change falls below a tenth of the last improvement
+		change, at most max_partial_sweeps times.
+	V0: np.ndarray[nS] or None
+		Initial value function, zeros by default. Convergence is guaranteed
+		from any V0 with B V0 >= V0, B the Bellman operator, which holds for
+		zeros when rewards are non-negative, as on the lakes.
+	Returns
+	-------
+	value_function: np.ndarray[nS]
+	policy: np.ndarray[nS]
+	"""
+
+	mdp = as_mdp(P, nS, nA)
+	monitor = SweepMonitor(gamma, tol, stop, callback)
+	value_function = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
+	partial_sweeps = 0
+	while True:
+		q = mdp.q_values(value_function, gamma)
+		vf2 = np.max(q, axis=1)
+		if monitor.update(value_function, vf2, backups=nS * (1 + partial_sweeps)):
+			break
+		policy = np.argmax(q, axis=1)
+		P_pi, r_pi = mdp.policy_model(policy)
+		improvement = np.max(np.abs(vf2 - value_function))
+		value_function = vf2
+		partial_sweeps = 0
+		while partial_sweeps < (max_partial_sweeps if k == 'adaptive' else k):
+			vf2 = r_pi + gamma * P_pi.dot(value_function)
+			change = np.max(np.abs(vf2 - value_function))
+			value_function = vf2
+			partial_sweeps += 1
+			if k == 'adaptive' and change < 0.1 * improvement:
+				break
+
+	policy = np.argmax(q, axis=1)
+	value_function = monitor.estimate(value_function, vf2)
+	return value_function, policy
+
+def value_iteration(P, nS, nA, gamma=0.9, tol=1e-3, stop='span', callback=None, V0=None):
 	"""
 	Learn value function and policy by using value iteration method for a given
 	gamma and environment.
@@ -158,38 +319,34 @@ def value_iteration(P, nS, nA, gamma=0.9, tol=1e-3):
 	----------
 	P, nS, nA, gamma:
 		defined at beginning of file
-	tol: float
-		Terminate value iteration when
-			max |value_function(s) - prev_value_function(s)| < tol
+	tol, stop, callback:
+		defined at beginning of file
+	V0: np.ndarray[nS] or None
+		Initial value function, zeros by default. A good warm start (e.g. the
+		solution for a nearby gamma) saves sweeps; the stopping rule and its
+		guarantee do not depend on it.
 	Returns:
 	----------
 	value_function: np.ndarray[nS]
 	policy: np.ndarray[nS]
 	"""
 
-	value_function = np.zeros(nS)
-	policy = np.zeros(nS, dtype=int)
+	mdp = as_mdp(P, nS, nA)
+	monitor = SweepMonitor(gamma, tol, stop, callback, backups_per_sweep=nS)
+	value_function = np.zeros(nS) if V0 is None else np.array(V0, dtype=float)
 	############################
 	# YOUR IMPLEMENTATION HERE #
-	diff = 1
-	while diff > tol:
-		vf2 = np.copy(value_function)
-		for s in range(nS):
-			action_values = []
-			for a in range(nA):
-				probability, nextstate, reward, _ = P[s][a][0]
-				action_values.append(calculate_value(reward, gamma, probability, vf2[nextstate]))
-			vf2[s] = np.max(action_values)
-		diff = np.sum(np.abs(value_function - vf2))
+	while True:
+		q = mdp.q_values(value_function, gamma)
+		vf2 = np.max(q, axis=1)
+		if monitor.update(value_function, vf2):
+			break
 		value_function = vf2
 
-	# Get best policy
-	for s in range(nS):
-		action_values = []
-		for a in range(nA):
-			probability, nextstate, reward, _ = P[s][a][0]
-			action_values.append(calculate_value(reward, gamma, probability, vf2[nextstate]))
-		policy[s] = np.argmax(action_values)
+	# The policy greedy with respect to the last backed-up values is the one
+	# the span bound certifies
+	policy = np.argmax(q, axis=1)
+	value_function = monitor.estimate(value_function, vf2)
 	############################
 	return value_function, policy
 
@@ -224,6 +381,15 @@ def render_single(env, policy, max_steps=100):
   	print("Episode reward: %f" % episode_reward)
 
 
+def print_policy_metrics(env, policy, gamma=0.9):
+	"""Print the exact goal probability, return and episode length of a policy,
+	see policy_metrics.evaluate_policy()."""
+	metrics = evaluate_policy(env, policy, gamma)
+	print("Success probability: %f" % metrics['success_probability'])
+	print("Expected discounted return: %f" % metrics['expected_return'])
+	print("Expected episode length: %f" % metrics['expected_length'])
+
+
 # Edit below to run policy and value iteration on different environments and
 # visualize the resulting policies in action!
 # You may change the parameters in the functions below
@@ -233,13 +399,18 @@ if __name__ == "__main__":
 	
 	# Make gym environment
 	env = gym.make(args.env)
+	mdp = compile_mdp(env.P, env.nS, env.nA)
 
 	print("\n" + "-"*25 + "\nBeginning Policy Iteration\n" + "-"*25)
-	V_pi, p_pi = policy_iteration(env.P, env.nS, env.nA, gamma=0.9, tol=1e-3)
-	render_single(env, p_pi, 100)
+	V_pi, p_pi = policy_iteration(mdp, env.nS, env.nA, gamma=0.9, tol=1e-3)
+	print_policy_metrics(env, p_pi, gamma=0.9)
+	if args.render:
+		render_single(env, p_pi, 100)
 
 	print("\n" + "-"*25 + "\nBeginning Value Iteration\n" + "-"*25)
-	V_vi, p_vi = value_iteration(env.P, env.nS, env.nA, gamma=0.9, tol=1e-3)
-	render_single(env, p_vi, 100)
+	V_vi, p_vi = value_iteration(mdp, env.nS, env.nA, gamma=0.9, tol=1e-3)
+	print_policy_metrics(env, p_vi, gamma=0.9)
+	if args.render:
+		render_single(env, p_vi, 100)
 
 